@@ -1,10 +1,26 @@
 from django.contrib import admin
 
 # Register your models here.
-from chat.models import Model, Thread, Prompt, ModelType
+from chat.models import (
+    Model, Thread, Prompt, ModelType, GenerationJob, ModelFallback, UserUsage, ModelUsage,
+)
+
+
+class ModelFallbackInline(admin.TabularInline):
+    model = ModelFallback
+    fk_name = "model"
+    extra = 1
+
+
+class ModelAdmin(admin.ModelAdmin):
+    inlines = [ModelFallbackInline]
+
 
 # Register your models here.
-admin.site.register(Model)
+admin.site.register(Model, ModelAdmin)
 admin.site.register(Thread)
 admin.site.register(Prompt)
 admin.site.register(ModelType)
+admin.site.register(GenerationJob)
+admin.site.register(UserUsage)
+admin.site.register(ModelUsage)
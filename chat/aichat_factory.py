@@ -1,50 +1,303 @@
 from dotenv import load_dotenv
-from .models import Thread
+from .models import Thread, Model
 import os
+import logging
+import threading
+import time
+from collections import defaultdict
+from cachetools import TTLCache
+from django.conf import settings
 from langchain.schema import HumanMessage
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
-from langchain_core.messages import AIMessage
+from .fake_llm import FAKE_PROVIDER, FakeChatModel
+from .history import history_cache
+from .tokens import count_tokens, trim_history
+from .response_cache import response_cache
+from .semantic_cache import EmbeddingsUnavailable, semantic_cache
+from .scheduler import provider_scheduler
+from .metrics import current_request, record_provider_call
+from .resilience import (
+    acall_with_fallbacks,
+    call_with_fallbacks,
+    circuit_breaker,
+    healthy_candidates,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def build_chat_model(model: Model):
+    provider = model.provider.name
+
+    if provider == FAKE_PROVIDER:
+        return FakeChatModel(
+            latency=settings.FAKE_LLM_LATENCY,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            failure_rate=settings.FAKE_LLM_FAILURE_RATE,
+        )
+
+    if provider != "ollama":
+        return init_chat_model(
+            model.identifier,
+            model_provider=provider,
+            api_key=os.getenv(model.api_environment_variable),
+            temperature=model.temperature,
+        )
+
+    return init_chat_model(
+        model.identifier,
+        model_provider=provider,
+        temperature=model.temperature,
+        timeout=30
+    )
+
+
+class ChatModelPool:
+    """
+    Process-wide pool of initialized chat model clients, so warm requests
+    reuse the provider client (and its HTTP connections) instead of
+    calling init_chat_model again. Entries are evicted LRU when the pool
+    is full and expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._clients = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._keys_by_model = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(model: Model) -> tuple:
+        return (
+            model.provider.name,
+            model.identifier,
+            model.temperature,
+            model.api_environment_variable,
+        )
+
+    def get(self, model: Model):
+        key = self.key_for(model)
+
+        with self._lock:
+            chat_model = self._clients.get(key)
+        if chat_model is not None:
+            return chat_model
+
+        chat_model = build_chat_model(model)
+
+        with self._lock:
+            chat_model = self._clients.setdefault(key, chat_model)
+            self._keys_by_model[model.pk].add(key)
+        return chat_model
+
+    def invalidate(self, model_id: int):
+        with self._lock:
+            for key in self._keys_by_model.pop(model_id, set()):
+                self._clients.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._keys_by_model.clear()
+
+
+chat_model_pool = ChatModelPool(
+    maxsize=settings.CHAT_MODEL_POOL_SIZE,
+    ttl=settings.CHAT_MODEL_POOL_TTL,
+)
+
 
 class LangChainModel:
     def __init__(self, thread: Thread):
         try:
-            model = thread.model
-            provider = thread.model.provider.name
-
-            if provider != "ollama":
-                self._chat_model = init_chat_model(
-                    model.identifier,
-                    model_provider=provider,
-                    api_key=os.getenv(model.api_environment_variable),
-                    temperature=model.temperature,
-                )
-            else:
-                self._chat_model = init_chat_model(
-                    model.identifier,
-                    model_provider=provider,
-                    temperature=model.temperature,
-                    timeout=30
-                )
-
-            prompts = thread.prompts.all().order_by("created_at")
-
-            self._messages = []
-            for prompt in prompts:
-                self._messages.append(HumanMessage(content=prompt.prompt))
-                self._messages.append(AIMessage(content=prompt.response))
+            self._model = thread.model
+            self._user_id = thread.user_id
+            self._candidates = [self._model] + self._model.get_fallbacks()
+            chat_model_pool.get(self._model)
+
+            self._messages, self._token_counts = history_cache.get_history(thread)
+            self._prompt_vector = None
+            self._input_tokens = 0
+            # Provider usage of the last answer, None when it came from a cache
+            self.usage = None
+            # Captured here: streamed responses are consumed after the view returns
+            self._request_metrics = current_request()
 
         except Exception as e:
             raise Exception(f"Error creating LangChain model\n{e}")
 
+    def _add_user_prompt(self, user_prompt: str):
+        # Drop the oldest turns that don't fit in the model's token budget
+        budget = self._model.context_token_budget
+        if budget is not None:
+            budget = max(budget - count_tokens(user_prompt), 0)
+        self._messages = trim_history(self._messages, self._token_counts, budget)
+        self._messages.append(HumanMessage(content=user_prompt))
+
+        kept_turns = len(self._messages) // 2
+        self._input_tokens = count_tokens(user_prompt) + (
+            sum(self._token_counts[-kept_turns:]) if kept_turns else 0)
+
+    def _record_call(
+        self, model: Model, seconds: float, usage, response: str, first_token=None
+    ) -> dict:
+        # Provider-reported usage when available, local estimates otherwise
+        usage = usage or {}
+        input_tokens = usage.get("input_tokens") or self._input_tokens
+        output_tokens = usage.get("output_tokens") or count_tokens(response)
+        record_provider_call(
+            self._request_metrics, model, seconds, input_tokens, output_tokens, first_token)
+        return {
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency": seconds,
+        }
+
+    def _cached_response(self, user_prompt: str):
+        if response_cache.is_enabled(self._model):
+            cached = response_cache.get(self._model, self._messages)
+            if cached is not None:
+                return cached
+
+        if semantic_cache.is_enabled(self._model):
+            try:
+                self._prompt_vector = semantic_cache.embed(user_prompt)
+            except EmbeddingsUnavailable:
+                return None
+            except Exception:
+                logger.exception("Error embedding prompt for the semantic cache")
+                return None
+            return semantic_cache.lookup(self._model, self._messages[:-1], self._prompt_vector)
+
+        return None
+
+    def _cache_response(self, response: str):
+        if response_cache.is_enabled(self._model):
+            response_cache.set(self._model, self._messages, response)
+        if self._prompt_vector is not None:
+            semantic_cache.add(self._model, self._messages[:-1], self._prompt_vector, response)
+
+    async def _acached_response(self, user_prompt: str):
+        if response_cache.is_enabled(self._model):
+            cached = await response_cache.aget(self._model, self._messages)
+            if cached is not None:
+                return cached
+
+        if semantic_cache.is_enabled(self._model):
+            try:
+                self._prompt_vector = await semantic_cache.aembed(user_prompt)
+            except EmbeddingsUnavailable:
+                return None
+            except Exception:
+                logger.exception("Error embedding prompt for the semantic cache")
+                return None
+            return semantic_cache.lookup(self._model, self._messages[:-1], self._prompt_vector)
+
+        return None
+
+    async def _acache_response(self, response: str):
+        if response_cache.is_enabled(self._model):
+            await response_cache.aset(self._model, self._messages, response)
+        if self._prompt_vector is not None:
+            semantic_cache.add(self._model, self._messages[:-1], self._prompt_vector, response)
+
+    def _invoke(self, model: Model):
+        chat_model = chat_model_pool.get(model)
+
+        def invoke():
+            started = time.perf_counter()
+            response = chat_model.invoke(self._messages)
+            usage = self._record_call(
+                model, time.perf_counter() - started,
+                getattr(response, "usage_metadata", None), response.content)
+            return response, usage
+
+        return provider_scheduler.run(model, self._user_id, invoke)
+
+    async def _ainvoke(self, model: Model):
+        chat_model = chat_model_pool.get(model)
+
+        async def ainvoke():
+            started = time.perf_counter()
+            response = await chat_model.ainvoke(self._messages)
+            usage = self._record_call(
+                model, time.perf_counter() - started,
+                getattr(response, "usage_metadata", None), response.content)
+            return response, usage
+
+        return await provider_scheduler.arun(model, self._user_id, ainvoke)
+
     def get_response(self, user_prompt: str) -> str:
         try:
-            self._messages.append(HumanMessage(content=user_prompt))
-            response = self._chat_model.invoke(self._messages)
+            self._add_user_prompt(user_prompt)
+            cached = self._cached_response(user_prompt)
+            if cached is not None:
+                return cached
+
+            response, self.usage = call_with_fallbacks(self._candidates, self._invoke)
+            self._cache_response(response.content)
+            return response.content
+
+        except Exception as e:
+            raise Exception(f"Error getting response from AI API.\n{e}")
+
+    async def aget_response(self, user_prompt: str) -> str:
+        try:
+            self._add_user_prompt(user_prompt)
+            cached = await self._acached_response(user_prompt)
+            if cached is not None:
+                return cached
+
+            response, self.usage = await acall_with_fallbacks(self._candidates, self._ainvoke)
+            await self._acache_response(response.content)
             return response.content
 
         except Exception as e:
             raise Exception(f"Error getting response from AI API.\n{e}")
+
+    async def astream_response(self, user_prompt: str):
+        try:
+            self._add_user_prompt(user_prompt)
+            cached = await self._acached_response(user_prompt)
+            if cached is not None:
+                yield cached
+                return
+
+            last_error = None
+            for model in healthy_candidates(self._candidates):
+                chunks = []
+                usage = None
+                first_token = None
+                try:
+                    async with provider_scheduler.aslot(model, self._user_id):
+                        started = time.perf_counter()
+                        async for chunk in chat_model_pool.get(model).astream(self._messages):
+                            if getattr(chunk, "usage_metadata", None):
+                                usage = chunk.usage_metadata
+                            if chunk.content:
+                                if first_token is None:
+                                    first_token = time.perf_counter() - started
+                                chunks.append(chunk.content)
+                                yield chunk.content
+                except Exception as e:
+                    circuit_breaker.record_failure(model.provider.name)
+                    if chunks:
+                        # Part of the answer is already sent, can't switch models
+                        raise
+                    last_error = e
+                    continue
+
+                circuit_breaker.record_success(model.provider.name)
+                response = "".join(chunks)
+                self.usage = self._record_call(
+                    model, time.perf_counter() - started, usage, response, first_token)
+                await self._acache_response(response)
+                return
+
+            raise last_error
+
+        except Exception as e:
+            raise Exception(f"Error getting response from AI API.\n{e}")
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import math
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.db import IntegrityError
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .models import Thread, Model, GenerationJob
+from .serializers import ThreadSerializer, GenerationJobSerializer
+from .aichat_factory import LangChainModel
+from .writes import prompt_writer
+
+# These views are plain Django async views (DRF has no async support), so
+# they must be served through llmsbackend/asgi.py to avoid tying up a
+# worker for the whole generation. Authentication is JWT only.
+
+JOB_MAX_WAIT = 30
+JOB_POLL_INTERVAL = 0.5
+
+
+def _authenticate(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def _get_user(request):
+    return await sync_to_async(_authenticate)(request)
+
+
+def _unauthorized():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."},
+        status=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+def _read_json(request) -> dict:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return {}
+    # e.g. a JSON list or string body
+    return data if isinstance(data, dict) else {}
+
+
+def _prompt_required():
+    return JsonResponse({"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _sse_event(data: dict, event: str = None) -> str:
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
+
+
+async def _get_thread(thread_id, user):
+    return await Thread.objects.select_related("model__provider").filter(
+        id=thread_id, user=user).afirst()
+
+
+@csrf_exempt
+@require_POST
+async def get_response_for_prompt(request, thread_id):
+    user = await _get_user(request)
+    if user is None:
+        return _unauthorized()
+
+    thread = await _get_thread(thread_id, user)
+    if not thread:
+        return JsonResponse({"error": "Thread not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    user_prompt = _read_json(request).get("user_prompt")
+    if not user_prompt:
+        return _prompt_required()
+
+    try:
+        aichat_model = await sync_to_async(LangChainModel)(thread)
+        response = await aichat_model.aget_response(user_prompt=user_prompt)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Save the prompt and response, a single insert
+    await prompt_writer.asave(thread, user_prompt, response, aichat_model.usage)
+    # Return the response
+    return JsonResponse({"response": response}, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@require_POST
+async def start_thread(request, model_id):
+    user = await _get_user(request)
+    if user is None:
+        return _unauthorized()
+
+    title = _read_json(request).get("title")
+    if not title:
+        return JsonResponse({"error": "Title is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    model = await Model.objects.select_related("provider").filter(id=model_id).afirst()
+    if not model:
+        return JsonResponse({"error": "Model not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        thread = await Thread.objects.acreate(model=model, title=title, user=user)
+    except IntegrityError:
+        return JsonResponse({"error": "There is already a thread with this title"}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = ThreadSerializer(thread)
+    return JsonResponse({"thread": serializer.data}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def stream_response_for_prompt(request, thread_id):
+    user = await _get_user(request)
+    if user is None:
+        return _unauthorized()
+
+    thread = await _get_thread(thread_id, user)
+    if not thread:
+        return JsonResponse({"error": "Thread not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    user_prompt = _read_json(request).get("user_prompt")
+    if not user_prompt:
+        return _prompt_required()
+
+    try:
+        aichat_model = await sync_to_async(LangChainModel)(thread)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for token in aichat_model.astream_response(user_prompt=user_prompt):
+                chunks.append(token)
+                yield _sse_event({"token": token})
+        except Exception as e:
+            yield _sse_event({"error": str(e)}, event="error")
+            return
+
+        # Save the prompt and the full response once the stream ends
+        response = "".join(chunks)
+        await prompt_writer.asave(thread, user_prompt, response, aichat_model.usage)
+        yield _sse_event({"response": response}, event="done")
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@require_GET
+async def get_generation_job(request, job_id):
+    user = await _get_user(request)
+    if user is None:
+        return _unauthorized()
+
+    try:
+        wait = float(request.GET.get("wait", 0))
+    except ValueError:
+        wait = None
+    # nan would never reach the deadline
+    if wait is None or not math.isfinite(wait) or wait < 0:
+        return JsonResponse({"error": "Invalid wait"}, status=status.HTTP_400_BAD_REQUEST)
+    wait = min(wait, JOB_MAX_WAIT)
+
+    # Long-poll: keep checking until the job finishes or `wait` seconds pass
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        job = await GenerationJob.objects.filter(id=job_id, user=user).afirst()
+        if not job:
+            return JsonResponse({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        if job.is_finished or loop.time() >= deadline:
+            break
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    serializer = GenerationJobSerializer(job)
+    return JsonResponse(serializer.data, status=status.HTTP_200_OK)
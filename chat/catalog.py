@@ -0,0 +1,54 @@
+import time
+import orjson
+import xxhash
+from django.conf import settings
+from django.core.cache import cache
+from .models import Model
+from .serializers import ModelSerializer
+
+CATALOG_CACHE_KEY = "chat:model-catalog"
+
+
+def build_catalog() -> dict:
+    models = Model.objects.select_related("provider").order_by("provider__name")
+    data = orjson.loads(orjson.dumps(ModelSerializer(models, many=True).data))
+    return {
+        "models": data,
+        "by_id": {model["id"]: model for model in data},
+        "etag": xxhash.xxh3_64_hexdigest(orjson.dumps(data)),
+        "last_modified": int(time.time()),
+    }
+
+
+def get_catalog() -> dict:
+    """
+    Serialized model catalog, built once and kept in the default cache
+    until a Model, ModelType or fallback changes (or CATALOG_CACHE_TTL
+    passes, for processes that didn't see the change).
+    """
+    catalog = cache.get(CATALOG_CACHE_KEY)
+    if catalog is None:
+        catalog = refresh_catalog()
+    return catalog
+
+
+def get_catalog_with(model_id: int) -> dict:
+    """
+    get_catalog(), rebuilt when it lacks model `model_id` although the
+    model exists, i.e. it was added by another process since the catalog
+    was cached here.
+    """
+    catalog = get_catalog()
+    if model_id not in catalog["by_id"] and Model.objects.filter(id=model_id).exists():
+        catalog = refresh_catalog()
+    return catalog
+
+
+def refresh_catalog() -> dict:
+    catalog = build_catalog()
+    cache.set(CATALOG_CACHE_KEY, catalog, settings.CATALOG_CACHE_TTL)
+    return catalog
+
+
+def invalidate_catalog():
+    cache.delete(CATALOG_CACHE_KEY)
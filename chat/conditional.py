@@ -0,0 +1,43 @@
+import xxhash
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def conditional_response(request, etag: str, last_modified: int = None, build_data=None):
+    """
+    Answer 304 when the client's If-None-Match / If-Modified-Since still
+    match, otherwise a Response with `build_data()`, so the payload is only
+    built and serialized when it is actually sent.
+    """
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = Response(build_data())
+
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def listing_etag(request, rows, *extra) -> tuple[str, dict]:
+    """
+    ETag for a listing of append-only `rows`, computed from their count and
+    highest id (one aggregate query) plus the request's query string,
+    without building the payload. Also returns the aggregate.
+    """
+    stats = rows.aggregate(count=Count("id"), last_id=Max("id"))
+    key = ":".join([str(stats["count"]), str(stats["last_id"]), request.get_full_path(), *extra])
+    return xxhash.xxh3_64_hexdigest(key), stats
+
+
+def page_etag(request, rows: list, *extra) -> str:
+    """
+    ETag for a keyset page from the ids of its `rows` plus the request's
+    query string. The page query runs anyway, so unlike listing_etag this
+    costs nothing however long the listing is.
+    """
+    key = ":".join([",".join(str(row["id"]) for row in rows), request.get_full_path(), *extra])
+    return xxhash.xxh3_64_hexdigest(key)
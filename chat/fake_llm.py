@@ -0,0 +1,109 @@
+import asyncio
+import random
+import threading
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+from .tokens import count_tokens
+
+# Models whose provider (ModelType.name) is this are answered by FakeChatModel
+FAKE_PROVIDER = "fake"
+
+WORDS = (
+    "the model answers with a deterministic sentence built from this small "
+    "vocabulary so that benchmarks compare like with like across runs and "
+    "machines while still producing text of a realistic length"
+).split()
+
+
+class FakeProviderError(Exception):
+    pass
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local chat model for load tests and benchmarks. Answers are derived
+    from the last message, so the same prompt always gets the same answer.
+    It waits `latency` seconds before the first token, then produces
+    `tokens_per_second` tokens per second (0: all at once), and fails a
+    `failure_rate` share of calls, drawn from a generator seeded with `seed`.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    failure_rate: float = 0.0
+    response_tokens: int = 40
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, context):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+    def _answer_tokens(self, messages: list) -> list:
+        prompt_rng = random.Random(f"{self.seed}:{messages[-1].content}")
+        return [
+            (" " if i else "") + prompt_rng.choice(WORDS) for i in range(self.response_tokens)
+        ]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0
+
+    def _usage(self, messages: list, tokens: list) -> dict:
+        input_tokens = sum(count_tokens(message.content) for message in messages)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": len(tokens),
+            "total_tokens": input_tokens + len(tokens),
+        }
+
+    def _result(self, messages: list, tokens: list) -> ChatResult:
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.latency + len(tokens) * self._token_delay())
+        if self._should_fail():
+            raise FakeProviderError("Fake provider failure")
+        return self._result(messages, tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.latency + len(tokens) * self._token_delay())
+        if self._should_fail():
+            raise FakeProviderError("Fake provider failure")
+        return self._result(messages, tokens)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.latency)
+        if self._should_fail():
+            raise FakeProviderError("Fake provider failure")
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self._token_delay())
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.latency)
+        if self._should_fail():
+            raise FakeProviderError("Fake provider failure")
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self._token_delay())
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
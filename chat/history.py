@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from langchain_core.messages import HumanMessage, AIMessage
+from .models import Thread, Prompt
+
+# Prompts newer than this are read again on every request instead of being
+# cached: a row inserted by a transaction still open could otherwise commit
+# with an id below the watermark and never be read
+HISTORY_LAG = timedelta(seconds=10)
+
+
+@dataclass
+class _CachedHistory:
+    last_prompt_id: int = 0
+    messages: list = field(default_factory=list)
+    token_counts: list = field(default_factory=list)
+    size: int = 0
+
+
+class ConversationHistoryCache:
+    """
+    Per-thread cache of LangChain messages and per-turn token counts. A
+    thread's entry remembers the id of the last prompt it contains, so a
+    request only loads (and builds messages for) prompts newer than that
+    instead of the whole thread. Prompts of the last HISTORY_LAG are not
+    cached yet. Entries are evicted LRU once `max_threads` or `max_chars`
+    (total prompt + response characters) is exceeded.
+    """
+
+    def __init__(self, max_threads: int, max_chars: int):
+        self._max_threads = max_threads
+        self._max_chars = max_chars
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_history(self, thread: Thread) -> tuple[list, list]:
+        with self._lock:
+            entry = self._entries.get(thread.id)
+            last_prompt_id = entry.last_prompt_id if entry else 0
+            cached_len = len(entry.messages) if entry else 0
+
+        new_prompts = thread.prompts.filter(
+            id__gt=last_prompt_id).defer("search_vector").order_by("created_at", "id")
+
+        settled_before = timezone.now() - HISTORY_LAG
+        new_messages = []
+        new_token_counts = []
+        uncounted = []
+        # The leading new prompts old enough to be cached
+        settled_turns = 0
+        new_size = 0
+        for prompt in new_prompts:
+            if prompt.token_count is None:
+                prompt.token_count = prompt.compute_token_count()
+                uncounted.append(prompt)
+            new_messages.append(HumanMessage(content=prompt.prompt))
+            new_messages.append(AIMessage(content=prompt.response))
+            new_token_counts.append(prompt.token_count)
+            if settled_turns == len(new_token_counts) - 1 and prompt.created_at < settled_before:
+                settled_turns += 1
+                new_size += len(prompt.prompt) + len(prompt.response)
+                last_prompt_id = max(last_prompt_id, prompt.id)
+
+        if uncounted:
+            # Rows saved before token counts were stored
+            Prompt.objects.bulk_update(uncounted, ["token_count"])
+
+        with self._lock:
+            current = self._entries.get(thread.id)
+            if current is not entry or (entry and len(entry.messages) != cached_len):
+                # Another request updated or evicted this entry meanwhile,
+                # leave the cache alone and answer from what was read
+                if entry is None:
+                    return new_messages, new_token_counts
+                return (
+                    entry.messages[:cached_len] + new_messages,
+                    entry.token_counts[:cached_len // 2] + new_token_counts,
+                )
+
+            if entry is None:
+                entry = _CachedHistory()
+                self._entries[thread.id] = entry
+            entry.messages.extend(new_messages[:settled_turns * 2])
+            entry.token_counts.extend(new_token_counts[:settled_turns])
+            entry.last_prompt_id = last_prompt_id
+            entry.size += new_size
+            self._size += new_size
+            self._entries.move_to_end(thread.id)
+
+            # Copies, since callers append the new user prompt
+            messages = entry.messages + new_messages[settled_turns * 2:]
+            token_counts = entry.token_counts + new_token_counts[settled_turns:]
+            self._evict()
+
+        return messages, token_counts
+
+    def invalidate(self, thread_id: int):
+        with self._lock:
+            self._discard(thread_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, thread_id: int):
+        entry = self._entries.pop(thread_id, None)
+        if entry:
+            self._size -= entry.size
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self._max_threads or self._size > self._max_chars
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+
+
+history_cache = ConversationHistoryCache(
+    max_threads=settings.HISTORY_CACHE_MAX_THREADS,
+    max_chars=settings.HISTORY_CACHE_MAX_CHARS,
+)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import GenerationJob, Thread
+from .aichat_factory import LangChainModel
+from .writes import build_prompt
+
+
+def enqueue_job(thread: Thread, user, prompt: str) -> GenerationJob:
+    return GenerationJob.objects.create(thread=thread, user=user, prompt=prompt)
+
+
+def claim_next_job():
+    """Mark the oldest pending job as running and return it, or None."""
+    with transaction.atomic():
+        job = (
+            GenerationJob.objects.select_for_update(skip_locked=True)
+            .filter(status=GenerationJob.PENDING)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = GenerationJob.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+        return job
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Put back jobs left running by a worker that died."""
+    return GenerationJob.objects.filter(
+        status=GenerationJob.RUNNING,
+        started_at__lt=timezone.now() - older_than,
+    ).update(status=GenerationJob.PENDING, started_at=None)
+
+
+def run_job(job: GenerationJob):
+    thread = Thread.objects.select_related("model__provider").get(id=job.thread_id)
+
+    try:
+        aichat_model = LangChainModel(thread)
+        response = aichat_model.get_response(user_prompt=job.prompt)
+    except Exception as e:
+        job.status = GenerationJob.FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        return
+
+    job.status = GenerationJob.DONE
+    job.response = response
+    job.finished_at = timezone.now()
+    # The prompt row and the finished job are written together or not at all
+    with transaction.atomic():
+        build_prompt(thread, job.prompt, response, aichat_model.usage).save()
+        job.save(update_fields=["status", "response", "finished_at"])
@@ -0,0 +1,51 @@
+import json
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from chat.models import Prompt
+from chat.renderers import ORJSONRenderer
+from chat.serializers import PromptSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's JSONRenderer and ORJSONRenderer on large prompt histories."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,1000,10000")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--response-chars", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'prompts':>8} {'json ms':>9} {'orjson ms':>10} {'speedup':>8} {'MB':>7}")
+
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            now = timezone.now()
+            prompts = [
+                Prompt(
+                    id=i,
+                    prompt=f"Question {i}: how does this work? ✓",
+                    response=("Answer line with unicode — ü " * options["response_chars"])[:options["response_chars"]],
+                    created_at=now - timedelta(minutes=i),
+                )
+                for i in range(size)
+            ]
+            data = PromptSerializer(prompts, many=True).data
+
+            timings = {}
+            outputs = {}
+            for name, renderer in (("json", JSONRenderer()), ("orjson", ORJSONRenderer())):
+                best = float("inf")
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    outputs[name] = renderer.render(data)
+                    best = min(best, time.perf_counter() - started)
+                timings[name] = best * 1000
+
+            if json.loads(outputs["json"]) != json.loads(outputs["orjson"]):
+                self.stderr.write(f"Output mismatch for {size} prompts")
+
+            self.stdout.write(
+                f"{size:>8} {timings['json']:>9.2f} {timings['orjson']:>10.2f} "
+                f"{timings['json'] / timings['orjson']:>7.1f}x {len(outputs['orjson']) / 1e6:>7.2f}")
@@ -0,0 +1,211 @@
+import json
+import math
+import re
+import threading
+import time
+from itertools import count
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.aichat_factory import chat_model_pool
+from chat.fake_llm import FAKE_PROVIDER
+from chat.models import Model, ModelType, Prompt, Thread
+
+ENDPOINTS = ("threads", "prompts", "response")
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the thread, prompt history and response endpoints at increasing "
+        "concurrency against a throwaway database and the local fake provider, "
+        "reporting latency percentiles, throughput and queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,4,16")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per endpoint and concurrency level.")
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+        parser.add_argument("--threads", type=int, default=50, help="Threads to seed.")
+        parser.add_argument("--prompts", type=int, default=20, help="Prompts to seed per thread.")
+        parser.add_argument("--latency", type=float, default=0.2,
+                            help="Fake provider latency, in seconds.")
+        parser.add_argument("--tokens-per-second", type=float, default=0)
+        parser.add_argument("--failure-rate", type=float, default=0)
+        parser.add_argument("--output", help="Results file (default: benchmarks/load-<time>.json).")
+        parser.add_argument("--compare", help="Earlier results file to compare with.")
+
+    def handle(self, *args, **options):
+        endpoints = options["endpoints"].split(",")
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        if options["requests"] < 1 or min(levels) < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+        baseline = self.load(options["compare"]) if options["compare"] else None
+
+        fake_llm = {
+            "FAKE_LLM_LATENCY": options["latency"],
+            "FAKE_LLM_TOKENS_PER_SECOND": options["tokens_per_second"],
+            "FAKE_LLM_FAILURE_RATE": options["failure_rate"],
+        }
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**fake_llm):
+                chat_model_pool.clear()
+                token, thread_ids = self.seed(options["threads"], options["prompts"])
+                results = [
+                    self.run(endpoint, concurrency, options["requests"], token, thread_ids)
+                    for endpoint in endpoints
+                    for concurrency in levels
+                ]
+        finally:
+            chat_model_pool.clear()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results, baseline)
+
+        output = Path(options["output"] or f"benchmarks/load-{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            "created_at": timezone.now().isoformat(),
+            "options": {
+                "requests": options["requests"],
+                "threads": options["threads"],
+                "prompts": options["prompts"],
+                "latency": options["latency"],
+                "tokens_per_second": options["tokens_per_second"],
+                "failure_rate": options["failure_rate"],
+            },
+            "results": results,
+        }, indent=2))
+        self.stdout.write(f"Results saved to {output}")
+
+    def load(self, path: str) -> dict:
+        try:
+            results = json.loads(Path(path).read_text())["results"]
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read results from {path}: {e}")
+        return {(result["endpoint"], result["concurrency"]): result for result in results}
+
+    def seed(self, thread_count: int, prompt_count: int):
+        user = User.objects.create_user(username="bench", password="bench")
+        provider = ModelType.objects.create(name=FAKE_PROVIDER)
+        model = Model.objects.create(name="Fake", identifier="fake-chat", provider=provider)
+        threads = Thread.objects.bulk_create(
+            Thread(title=f"Thread {i}", model=model, user=user) for i in range(thread_count))
+        Prompt.objects.bulk_create(
+            (
+                Prompt(thread=thread, prompt=f"Question {i}", response=f"Answer {i} " * 50)
+                for thread in threads
+                for i in range(prompt_count)
+            ),
+            batch_size=1000,
+        )
+        return str(AccessToken.for_user(user)), [thread.id for thread in threads]
+
+    def call(self, client: APIClient, endpoint: str, n: int, thread_ids: list):
+        thread_id = thread_ids[n % len(thread_ids)]
+        if endpoint == "threads":
+            return client.get("/api/threads")
+        if endpoint == "prompts":
+            return client.get(f"/api/threads/{thread_id}/prompts")
+        # A new question each time, so response caches never answer
+        return client.post(
+            f"/api/threads/{thread_id}/response", {"user_prompt": f"Benchmark question {n}"},
+            format="json")
+
+    def run(self, endpoint: str, concurrency: int, requests: int, token: str, thread_ids: list):
+        numbers = count()
+        lock = threading.Lock()
+        durations, queries, errors = [], [], []
+
+        def worker():
+            # Unhandled view errors count as 500s instead of stopping the worker
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                while True:
+                    with lock:
+                        n = next(numbers)
+                    if n >= requests:
+                        return
+                    started = time.perf_counter()
+                    response = self.call(client, endpoint, n, thread_ids)
+                    duration = time.perf_counter() - started
+
+                    match = QUERIES.search(response.get("Server-Timing", ""))
+                    with lock:
+                        durations.append(duration)
+                        if match:
+                            queries.append(int(match.group(1)))
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        durations.sort()
+        return {
+            "endpoint": endpoint,
+            "concurrency": concurrency,
+            "requests": len(durations),
+            "errors": len(errors),
+            "rps": round(len(durations) / elapsed, 2),
+            "p50_ms": round(percentile(durations, 50) * 1000, 2),
+            "p95_ms": round(percentile(durations, 95) * 1000, 2),
+            "p99_ms": round(percentile(durations, 99) * 1000, 2),
+            "queries": round(sum(queries) / len(queries), 2) if queries else None,
+        }
+
+    def report(self, results: list, baseline: dict = None):
+        header = (f"{'endpoint':>9} {'conc':>5} {'reqs':>6} {'errors':>6} {'rps':>9} "
+                  f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+        if baseline is not None:
+            header += f" {'rps Δ':>8} {'p95 Δ':>8}"
+        self.stdout.write(header)
+
+        for result in results:
+            line = (
+                f"{result['endpoint']:>9} {result['concurrency']:>5} {result['requests']:>6} "
+                f"{result['errors']:>6} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} "
+                f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                f"{result['queries'] if result['queries'] is not None else '-':>8}"
+            )
+            if baseline is not None:
+                before = baseline.get((result["endpoint"], result["concurrency"]))
+                if before:
+                    line += (f" {self.change(before['rps'], result['rps']):>8}"
+                             f" {self.change(before['p95_ms'], result['p95_ms']):>8}")
+            self.stdout.write(line)
+
+    @staticmethod
+    def change(before: float, after: float) -> str:
+        return f"{(after - before) / before:+.0%}" if before else "-"
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from chat.semantic_cache import VectorIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the semantic cache index: hit rate and lookup latency of "
+        "brute force vs IVF search as the index grows. Uses synthetic "
+        "embeddings, so no embedding model is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,50000,100000")
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--threshold", type=float, default=0.9)
+        parser.add_argument("--noise", type=float, default=0.02,
+                            help="Per-dimension noise that turns a prompt into a paraphrase")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        dim = options["dim"]
+        sizes = [int(size) for size in options["sizes"].split(",")]
+
+        self.stdout.write(
+            f"{'size':>8} {'index':>6} {'hit rate':>9} {'false hits':>11} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'build s':>8}")
+
+        for size in sizes:
+            vectors = rng.standard_normal((size, dim), dtype=np.float32)
+
+            # Paraphrases of cached prompts should hit, unrelated prompts should miss
+            targets = rng.choice(size, size=options["queries"], replace=False)
+            paraphrases = vectors[targets] + rng.normal(
+                0, options["noise"], (len(targets), dim)).astype(np.float32)
+            unrelated = rng.standard_normal((options["queries"], dim), dtype=np.float32)
+
+            for name, ann_threshold in (("brute", size + 1), ("ivf", 1)):
+                index = VectorIndex(ann_threshold=ann_threshold)
+                started = time.perf_counter()
+                for i, vector in enumerate(vectors):
+                    index.add(vector, i)
+                build_time = time.perf_counter() - started
+
+                latencies = []
+                hits = 0
+                for target, query in zip(targets, paraphrases):
+                    started = time.perf_counter()
+                    similarity, value = index.search(query)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    hits += similarity >= options["threshold"] and value == target
+
+                false_hits = sum(
+                    index.search(query)[0] >= options["threshold"] for query in unrelated)
+
+                self.stdout.write(
+                    f"{size:>8} {name:>6} {hits / len(targets):>9.1%} "
+                    f"{false_hits / len(unrelated):>11.1%} "
+                    f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 95):>8.3f} "
+                    f"{build_time:>8.2f}")
@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chat.models import Model, ModelType, Prompt, Thread
+from chat.serializers import (
+    PromptSerializer,
+    ThreadSerializer,
+    serialize_prompt_rows,
+    serialize_thread_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare the DRF serializers with the row serializers used by the list endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,1000,10000")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def best_of(self, repeat, call):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = call()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000, result
+
+    def handle(self, *args, **options):
+        provider = ModelType(id=1, name="openai")
+        model = Model(id=1, name="GPT", identifier="gpt-4o", provider=provider)
+
+        self.stdout.write(f"{'rows':>8} {'kind':>7} {'drf ms':>9} {'rows ms':>9} {'speedup':>8}")
+
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            now = timezone.now()
+            threads = [
+                Thread(id=i, title=f"Thread {i}", model=model, user_id=1,
+                       created_at=now - timedelta(hours=i))
+                for i in range(size)
+            ]
+            thread_rows = [
+                {
+                    "id": thread.id,
+                    "title": thread.title,
+                    "created_at": thread.created_at,
+                    "model_id": model.id,
+                    "user_id": thread.user_id,
+                    "model__name": model.name,
+                    "model__provider__name": provider.name,
+                    "model__identifier": model.identifier,
+                }
+                for thread in threads
+            ]
+            prompts = [
+                Prompt(id=i, prompt=f"Question {i}", response=f"Answer {i}",
+                       created_at=now - timedelta(minutes=i))
+                for i in range(size)
+            ]
+            prompt_rows = [
+                {"id": p.id, "prompt": p.prompt, "response": p.response, "created_at": p.created_at}
+                for p in prompts
+            ]
+
+            for kind, drf, fast in (
+                ("threads",
+                 lambda: ThreadSerializer(threads, many=True).data,
+                 lambda: serialize_thread_rows(thread_rows)),
+                ("prompts",
+                 lambda: PromptSerializer(prompts, many=True).data,
+                 lambda: serialize_prompt_rows(prompt_rows)),
+            ):
+                drf_ms, expected = self.best_of(options["repeat"], drf)
+                fast_ms, actual = self.best_of(options["repeat"], fast)
+
+                if [dict(item) for item in expected] != actual:
+                    self.stderr.write(f"Output mismatch for {size} {kind}")
+
+                self.stdout.write(
+                    f"{size:>8} {kind:>7} {drf_ms:>9.2f} {fast_ms:>9.2f} {drf_ms / fast_ms:>7.1f}x")
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from chat.usage import ROLLUP_BATCH_SIZE, roll_up_usage
+
+
+class Command(BaseCommand):
+    help = "Add the token usage of new prompts to the per-user and per-model rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Keep running, rolling up new prompts every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while processed := roll_up_usage(options["batch_size"]):
+                total += processed
+            if total:
+                self.stdout.write(f"Rolled up {total} prompt(s)")
+
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
+            close_old_connections()
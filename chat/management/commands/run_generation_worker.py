@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from chat.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+# Longest wait between attempts while the database keeps failing
+MAX_BACKOFF = 30
+
+
+class Command(BaseCommand):
+    help = "Process queued LLM generation jobs (threads/<id>/response?async=1)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Number of jobs processed in parallel")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument("--stale-after", type=int, default=600,
+                            help="Requeue jobs running for longer than this many seconds")
+        parser.add_argument("--requeue-interval", type=int, default=60,
+                            help="Seconds between checks for stale jobs")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+
+        self.stdout.write(f"Starting {options['concurrency']} generation worker(s)")
+        executor = ThreadPoolExecutor(max_workers=options["concurrency"])
+        for _ in range(options["concurrency"]):
+            executor.submit(self.work, options["poll_interval"])
+
+        # Jobs left running by a worker that died, here or in another process
+        while True:
+            try:
+                close_old_connections()
+                requeued = requeue_stale_jobs(stale_after)
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} stale job(s)")
+            except Exception as e:
+                self.stderr.write(f"Requeueing stale jobs failed: {e}")
+                connection.close()
+            time.sleep(options["requeue_interval"])
+
+    def work(self, poll_interval):
+        failures = 0
+        try:
+            while True:
+                try:
+                    close_old_connections()
+                    job = claim_next_job()
+                except Exception as e:
+                    # e.g. during a database failover: drop the connection and retry later
+                    failures += 1
+                    self.stderr.write(f"Claiming a job failed: {e}")
+                    connection.close()
+                    time.sleep(min(poll_interval * 2 ** failures, MAX_BACKOFF))
+                    continue
+                failures = 0
+
+                if job is None:
+                    time.sleep(poll_interval)
+                    continue
+
+                try:
+                    run_job(job)
+                except Exception as e:
+                    self.stderr.write(f"Job {job.id} crashed: {e}")
+        finally:
+            connection.close()
@@ -0,0 +1,236 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Seconds, from a cached response to a long generation
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets: memory per label set stays
+    constant however many values are observed.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, counts[:], total) for labels, (counts, total) in self._series.items()]
+
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time spent handling requests.",
+    ("endpoint", "method", "status"), DURATION_BUCKETS)
+db_queries = Histogram(
+    "http_db_queries", "Database queries per request.", ("endpoint",), QUERY_COUNT_BUCKETS)
+db_duration = Histogram(
+    "http_db_duration_seconds", "Time per request spent in database queries.",
+    ("endpoint",), DURATION_BUCKETS)
+serialization_duration = Histogram(
+    "http_serialization_duration_seconds", "Time per request spent rendering JSON.",
+    ("endpoint",), DURATION_BUCKETS)
+provider_duration = Histogram(
+    "llm_request_duration_seconds", "Duration of provider calls.",
+    ("endpoint", "provider", "model"), DURATION_BUCKETS)
+time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time until a streamed provider call sends its first token.",
+    ("endpoint", "provider", "model"), DURATION_BUCKETS)
+provider_tokens = Counter(
+    "llm_tokens_total", "Tokens sent to (input) and received from (output) providers.",
+    ("endpoint", "provider", "model", "kind"))
+
+METRICS = [
+    request_duration,
+    db_queries,
+    db_duration,
+    serialization_duration,
+    provider_duration,
+    time_to_first_token,
+    provider_tokens,
+]
+
+
+class RequestMetrics:
+    """What a single request spent its time on, for Server-Timing."""
+
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.provider_time = 0.0
+        self.time_to_first_token = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    @property
+    def endpoint(self) -> str:
+        # The URL pattern, not the path, to keep label cardinality bounded
+        resolver_match = getattr(self.request, "resolver_match", None)
+        return resolver_match.route if resolver_match is not None else "unmatched"
+
+    def server_timing(self) -> str:
+        entries = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f"ser;dur={self.serialization_time * 1000:.1f}",
+        ]
+        if self.provider_time:
+            entries.append(
+                f'llm;dur={self.provider_time * 1000:.1f};'
+                f'desc="{self.input_tokens} in, {self.output_tokens} out tokens"')
+        if self.time_to_first_token is not None:
+            entries.append(f"ttft;dur={self.time_to_first_token * 1000:.1f}")
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def start_request(request) -> RequestMetrics:
+    metrics = RequestMetrics(request)
+    _current.set(metrics)
+    return metrics
+
+
+def current_request() -> RequestMetrics | None:
+    return _current.get()
+
+
+def finish_request(metrics: RequestMetrics, status_code: int):
+    endpoint = metrics.endpoint
+    request_duration.observe(
+        (endpoint, metrics.request.method, str(status_code)),
+        time.perf_counter() - metrics.started)
+    db_queries.observe((endpoint,), metrics.db_queries)
+    db_duration.observe((endpoint,), metrics.db_time)
+    if metrics.serialization_time:
+        serialization_duration.observe((endpoint,), metrics.serialization_time)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding query counts and time to the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def record_serialization(seconds: float):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.serialization_time += seconds
+
+
+def record_provider_call(
+    metrics: RequestMetrics | None,
+    model,
+    seconds: float,
+    input_tokens: int,
+    output_tokens: int,
+    first_token: float = None,
+):
+    """
+    Record a finished provider call of `model`. `metrics` is the request
+    it was made for, None outside requests (e.g. the generation worker).
+    """
+    labels = (metrics.endpoint if metrics else "background", model.provider.name, model.identifier)
+    provider_duration.observe(labels, seconds)
+    provider_tokens.inc(labels + ("input",), input_tokens)
+    provider_tokens.inc(labels + ("output",), output_tokens)
+    if first_token is not None:
+        time_to_first_token.observe(labels, first_token)
+
+    if metrics is not None:
+        metrics.provider_time += seconds
+        metrics.input_tokens += input_tokens
+        metrics.output_tokens += output_tokens
+        if first_token is not None and metrics.time_to_first_token is None:
+            metrics.time_to_first_token = first_token
+
+
+def cache_stats_lines(name: str, documentation: str, stats: dict) -> list:
+    """Hit/miss counters per model identifier from a cache's `stats()`."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+    for identifier, counts in stats.items():
+        for result in ("hits", "misses"):
+            labels = _format_labels(("model", "result"), (identifier, result))
+            lines.append(f"{name}{labels} {counts[result]}")
+    return lines
+
+
+def render(*extra_lines: list) -> str:
+    lines = [line for metric in METRICS for line in metric.collect()]
+    for group in extra_lines:
+        lines.extend(group)
+    return "\n".join(lines) + "\n"
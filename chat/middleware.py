@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .metrics import finish_request, start_request
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures each request (database queries, JSON rendering, provider
+    calls), sends the breakdown as a Server-Timing header and aggregates
+    it for the /metrics endpoint. Streamed responses are aggregated once
+    the stream ends, their header only covers the time until it started.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = start_request(request)
+        response = self.get_response(request)
+        return self.finish(metrics, response)
+
+    async def __acall__(self, request):
+        metrics = start_request(request)
+        response = await self.get_response(request)
+        return self.finish(metrics, response)
+
+    def finish(self, metrics, response):
+        response["Server-Timing"] = metrics.server_timing()
+        if not response.streaming:
+            finish_request(metrics, response.status_code)
+            return response
+
+        content = response.streaming_content
+        if response.is_async:
+            async def measured_content():
+                try:
+                    async for chunk in content:
+                        yield chunk
+                finally:
+                    finish_request(metrics, response.status_code)
+        else:
+            def measured_content():
+                try:
+                    yield from content
+                finally:
+                    finish_request(metrics, response.status_code)
+
+        response.streaming_content = measured_content()
+        return response
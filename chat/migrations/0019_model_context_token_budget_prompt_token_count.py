@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0018_insert_modeltypes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="model",
+            name="context_token_budget",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Max tokens of thread history sent with each prompt, empty for no limit",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="token_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
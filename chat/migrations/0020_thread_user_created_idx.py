@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0019_model_context_token_budget_prompt_token_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="thread_user_created_idx"
+            ),
+        ),
+    ]
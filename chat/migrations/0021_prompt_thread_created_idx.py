@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0020_thread_user_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prompt",
+            index=models.Index(
+                fields=["thread", "created_at", "id"], name="prompt_thread_created_idx"
+            ),
+        ),
+    ]
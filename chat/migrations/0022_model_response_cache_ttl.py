@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0021_prompt_thread_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="model",
+            name="response_cache_ttl",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Seconds to cache responses to identical requests, empty to disable caching",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 13:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0022_model_response_cache_ttl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="model",
+            name="semantic_cache_threshold",
+            field=models.FloatField(
+                blank=True,
+                help_text="Min cosine similarity to reuse a cached response to a similar prompt, empty to disable the semantic cache",
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(0.0),
+                    django.core.validators.MaxValueValidator(1),
+                ],
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0024_generationjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="model",
+            name="max_concurrency",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Max simultaneous requests to this model, empty for no limit",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="model",
+            name="requests_per_minute",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Max requests per minute to this model, empty for no limit",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="modeltype",
+            name="max_concurrency",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Max simultaneous requests to this provider, empty for no limit",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="modeltype",
+            name="requests_per_minute",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Max requests per minute to this provider, empty for no limit",
+                null=True,
+            ),
+        ),
+    ]
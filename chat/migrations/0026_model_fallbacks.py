@@ -0,0 +1,76 @@
+# Generated by Django 5.2 on 2026-10-18 13:12
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0025_provider_limits"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="model",
+            name="hedge_delay",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds to wait for this model before also trying the next fallback, empty to use its observed p95 latency",
+                null=True,
+                validators=[django.core.validators.MinValueValidator(0.0)],
+            ),
+        ),
+        migrations.CreateModel(
+            name="ModelFallback",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField(default=0)),
+                (
+                    "fallback",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="chat.model",
+                    ),
+                ),
+                (
+                    "model",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fallback_links",
+                        to="chat.model",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["position", "id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="model",
+            name="fallbacks",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="fallback_for",
+                through="chat.ModelFallback",
+                through_fields=("model", "fallback"),
+                to="chat.model",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="modelfallback",
+            constraint=models.UniqueConstraint(
+                fields=("model", "fallback"), name="unique_model_fallback"
+            ),
+        ),
+    ]
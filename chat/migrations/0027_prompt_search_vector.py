@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 13:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0026_model_fallbacks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="prompt",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        "prompt", config="english", weight="A"
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        "response", config="english", weight="B"
+                    ),
+                    django.contrib.postgres.search.SearchConfig("english"),
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prompt",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="prompt_search_vector_idx"
+            ),
+        ),
+    ]
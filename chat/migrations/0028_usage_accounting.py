@@ -0,0 +1,172 @@
+# Generated by Django 5.2 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0027_prompt_search_vector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UsageRollupState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_prompt_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="model",
+            name="input_token_price",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                help_text="Price per million input tokens, for usage reports",
+                max_digits=12,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="model",
+            name="output_token_price",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                help_text="Price per million output tokens, for usage reports",
+                max_digits=12,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="input_tokens",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="latency",
+            field=models.FloatField(
+                blank=True, help_text="Seconds the provider took to answer", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="model",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="prompts",
+                to="chat.model",
+            ),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="model_identifier",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="prompt",
+            name="output_tokens",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="ModelUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prompts", models.PositiveIntegerField(default=0)),
+                ("input_tokens", models.PositiveBigIntegerField(default=0)),
+                ("output_tokens", models.PositiveBigIntegerField(default=0)),
+                (
+                    "latency",
+                    models.FloatField(
+                        default=0, help_text="Total seconds spent by the provider"
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "model",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="usage",
+                        to="chat.model",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("model", "date"), name="unique_model_usage"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="UserUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prompts", models.PositiveIntegerField(default=0)),
+                ("input_tokens", models.PositiveBigIntegerField(default=0)),
+                ("output_tokens", models.PositiveBigIntegerField(default=0)),
+                (
+                    "latency",
+                    models.FloatField(
+                        default=0, help_text="Total seconds spent by the provider"
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "model",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_usage",
+                        to="chat.model",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="usage",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "model", "date"), name="unique_user_usage"
+                    )
+                ],
+            },
+        ),
+    ]
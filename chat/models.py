@@ -3,11 +3,20 @@ from django.db.models import OuterRef, Subquery, DateTimeField
 from django.db.models.functions import TruncDate
 from collections import defaultdict
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .tokens import count_tokens
 
 
 class ModelType(models.Model):
     name = models.CharField(max_length=255, unique=True)
+    max_concurrency = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Max simultaneous requests to this provider, empty for no limit")
+    requests_per_minute = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Max requests per minute to this provider, empty for no limit")
 
     def __str__(self):
         return self.name
@@ -24,10 +33,61 @@ class Model(models.Model):
     temperature = models.FloatField(
         default=0.7, validators=[MinValueValidator(0.0), MaxValueValidator(1)]
     )
+    max_concurrency = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Max simultaneous requests to this model, empty for no limit")
+    requests_per_minute = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Max requests per minute to this model, empty for no limit")
+    fallbacks = models.ManyToManyField(
+        "self", through="ModelFallback", through_fields=("model", "fallback"),
+        symmetrical=False, blank=True, related_name="fallback_for")
+    hedge_delay = models.FloatField(
+        blank=True, null=True, validators=[MinValueValidator(0.0)],
+        help_text="Seconds to wait for this model before also trying the next fallback, "
+                  "empty to use its observed p95 latency")
+    context_token_budget = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Max tokens of thread history sent with each prompt, empty for no limit")
+    response_cache_ttl = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Seconds to cache responses to identical requests, empty to disable caching")
+    semantic_cache_threshold = models.FloatField(
+        blank=True, null=True, validators=[MinValueValidator(0.0), MaxValueValidator(1)],
+        help_text="Min cosine similarity to reuse a cached response to a similar prompt, "
+                  "empty to disable the semantic cache")
+    input_token_price = models.DecimalField(
+        max_digits=12, decimal_places=6, blank=True, null=True,
+        help_text="Price per million input tokens, for usage reports")
+    output_token_price = models.DecimalField(
+        max_digits=12, decimal_places=6, blank=True, null=True,
+        help_text="Price per million output tokens, for usage reports")
 
     def __str__(self):
         return f"{self.name} - ({self.provider.name})"
 
+    def get_fallbacks(self):
+        links = self.fallback_links.select_related("fallback__provider")
+        return [link.fallback for link in links]
+
+
+class ModelFallback(models.Model):
+    model = models.ForeignKey(
+        Model, related_name="fallback_links", on_delete=models.CASCADE)
+    fallback = models.ForeignKey(
+        Model, related_name="+", on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position", "id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["model", "fallback"], name="unique_model_fallback"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} -> {self.fallback}"
+
 
 class Thread(models.Model):
     title = models.CharField(max_length=255, unique=True)
@@ -37,20 +97,146 @@ class Thread(models.Model):
     user = models.ForeignKey(
         User, related_name="threads", on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's threads, newest first
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="thread_user_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.id} - {self.title}"
 
 
+# Text search configuration of Prompt.search_vector, queries must use the same
+SEARCH_CONFIG = "english"
+
+
 class Prompt(models.Model):
     prompt = models.TextField()
     response = models.TextField()
     thread = models.ForeignKey(
         Thread, related_name="prompts", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    token_count = models.PositiveIntegerField(blank=True, null=True)
+    # Provider usage of the exchange, empty when it was answered from a cache
+    model = models.ForeignKey(
+        Model, related_name="prompts", on_delete=models.SET_NULL, blank=True, null=True)
+    model_identifier = models.CharField(max_length=255, blank=True, default="")
+    input_tokens = models.PositiveIntegerField(blank=True, null=True)
+    output_tokens = models.PositiveIntegerField(blank=True, null=True)
+    latency = models.FloatField(
+        blank=True, null=True, help_text="Seconds the provider took to answer")
+    # Kept up to date by Postgres, matches in prompts rank above responses
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("prompt", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("response", weight="B", config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Paging through a thread's history in either direction
+            models.Index(
+                fields=["thread", "created_at", "id"], name="prompt_thread_created_idx"),
+            GinIndex(fields=["search_vector"], name="prompt_search_vector_idx"),
+        ]
 
     def __str__(self):
         return f"{self.prompt} - {self.created_at}"
 
+    def compute_token_count(self):
+        return count_tokens(self.prompt) + count_tokens(self.response)
+
+    def save(self, *args, **kwargs):
+        if self.token_count is None:
+            self.token_count = self.compute_token_count()
+        super().save(*args, **kwargs)
+
     @staticmethod
     def get_prompts_by_thread(thread_id):
-        return Prompt.objects.filter(thread_id=thread_id).order_by("created_at")
+        return Prompt.objects.filter(thread_id=thread_id).order_by("created_at", "id")
+
+
+class GenerationJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    thread = models.ForeignKey(
+        Thread, related_name="generation_jobs", on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        User, related_name="generation_jobs", on_delete=models.CASCADE)
+    prompt = models.TextField()
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    response = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest pending job
+            models.Index(fields=["status", "created_at"], name="job_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class UsageTotals(models.Model):
+    prompts = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    latency = models.FloatField(default=0, help_text="Total seconds spent by the provider")
+
+    class Meta:
+        abstract = True
+
+
+class UserUsage(UsageTotals):
+    """Daily provider usage per user and model, rolled up from prompts (chat/usage.py)."""
+    user = models.ForeignKey(
+        User, related_name="usage", on_delete=models.CASCADE)
+    model = models.ForeignKey(
+        Model, related_name="user_usage", on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "model", "date"], name="unique_user_usage"),
+        ]
+
+
+class ModelUsage(UsageTotals):
+    """Daily provider usage per model, rolled up from prompts (chat/usage.py)."""
+    model = models.ForeignKey(
+        Model, related_name="usage", on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model", "date"], name="unique_model_usage"),
+        ]
+
+
+class UsageRollupState(models.Model):
+    """Single row: the last prompt included in the usage rollups."""
+    last_prompt_id = models.BigIntegerField(default=0)
@@ -0,0 +1,39 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def rows_before(cursor: str) -> Q:
+    """Filter for rows after `cursor` in (-created_at, -id) order."""
+    created_at, pk = decode_cursor(cursor)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+
+def encode_rank_cursor(pk: int) -> str:
+    # Only the id: ts_rank is a float4, which does not compare equal to
+    # its text form, so the rank is recomputed from the row instead
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> int:
+    """Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded).decode())
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
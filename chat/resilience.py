@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from .models import Model
+
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """
+    Remembers unhealthy providers: after `failure_threshold` consecutive
+    failures a provider is skipped for `reset_timeout` seconds. Requests
+    are then let through again, and a single further failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = {}
+        self._open_until = {}
+        self._lock = threading.Lock()
+
+    def record_success(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._open_until.pop(key, None)
+
+    def record_failure(self, key: str):
+        with self._lock:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            if failures >= self._failure_threshold:
+                self._open_until[key] = time.monotonic() + self._reset_timeout
+
+    def is_open(self, key: str) -> bool:
+        with self._lock:
+            return self._open_until.get(key, 0) > time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model, for the p95 hedging delay."""
+
+    def __init__(self, samples: int):
+        self._samples = samples
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: int, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(model_id, deque(maxlen=self._samples)).append(seconds)
+
+    def p95(self, model_id: int):
+        with self._lock:
+            latencies = sorted(self._latencies.get(model_id, ()))
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.CIRCUIT_BREAKER_FAILURES,
+    reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+latency_tracker = LatencyTracker(LATENCY_SAMPLES)
+
+
+def healthy_candidates(candidates: list) -> list:
+    """Candidates whose provider circuit is closed, the primary if none is."""
+    return [
+        model for model in candidates if not circuit_breaker.is_open(model.provider.name)
+    ] or candidates[:1]
+
+
+def hedge_delay(model: Model):
+    if model.hedge_delay is not None:
+        return model.hedge_delay
+    return latency_tracker.p95(model.pk)
+
+
+def _timed(model: Model, call):
+    started = time.monotonic()
+    try:
+        result = call(model)
+    except Exception:
+        circuit_breaker.record_failure(model.provider.name)
+        raise
+    latency_tracker.record(model.pk, time.monotonic() - started)
+    circuit_breaker.record_success(model.provider.name)
+    return result
+
+
+async def _atimed(model: Model, call):
+    started = time.monotonic()
+    try:
+        result = await call(model)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        circuit_breaker.record_failure(model.provider.name)
+        raise
+    latency_tracker.record(model.pk, time.monotonic() - started)
+    circuit_breaker.record_success(model.provider.name)
+    return result
+
+
+def call_with_fallbacks(candidates: list, call):
+    """
+    Return `call(model)` for the first model in `candidates` to answer.
+    A failed call moves on to the next candidate, and a call still running
+    after its hedging delay has the next candidate started alongside it.
+    Threads can't be interrupted, so a losing call finishes in the
+    background and its result is discarded.
+    """
+    candidates = healthy_candidates(candidates)
+    if len(candidates) == 1:
+        return _timed(candidates[0], call)
+
+    remaining = iter(candidates)
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    pending = set()
+    last_error = None
+
+    def launch():
+        model = next(remaining, None)
+        if model is None:
+            return None
+        # Run in the caller's context, so per-request metrics are recorded
+        pending.add(executor.submit(contextvars.copy_context().run, _timed, model, call))
+        return model
+
+    try:
+        current = launch()
+        while pending:
+            delay = hedge_delay(current) if current is not None else None
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                current = launch()
+                continue
+
+            for future in done:
+                pending.discard(future)
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+            if not pending:
+                current = launch()
+        raise last_error
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+async def acall_with_fallbacks(candidates: list, call):
+    """Async version of call_with_fallbacks, losing calls are cancelled."""
+    candidates = healthy_candidates(candidates)
+    if len(candidates) == 1:
+        return await _atimed(candidates[0], call)
+
+    remaining = iter(candidates)
+    pending = set()
+    last_error = None
+
+    def launch():
+        model = next(remaining, None)
+        if model is None:
+            return None
+        pending.add(asyncio.ensure_future(_atimed(model, call)))
+        return model
+
+    try:
+        current = launch()
+        while pending:
+            delay = hedge_delay(current) if current is not None else None
+            done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                current = launch()
+                continue
+
+            for task in done:
+                pending.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            if not pending:
+                current = launch()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,77 @@
+import re
+import threading
+from collections import Counter
+import orjson
+import xxhash
+from django.conf import settings
+from django.core.cache import caches
+from .models import Model
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """
+    Cache of provider responses for identical requests, enabled per model
+    by setting `Model.response_cache_ttl`. Storage is the Django cache
+    configured as `settings.RESPONSE_CACHE_ALIAS`, so local memory, the
+    database or files can be used, with that backend's MAX_ENTRIES limit.
+    """
+
+    def __init__(self, alias: str):
+        self._alias = alias
+        self._hits = Counter()
+        self._misses = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    @staticmethod
+    def is_enabled(model: Model) -> bool:
+        return bool(model.response_cache_ttl)
+
+    @staticmethod
+    def key_for(model: Model, messages: list) -> str:
+        payload = orjson.dumps([
+            model.identifier,
+            model.temperature,
+            [(message.type, _normalize(message.content)) for message in messages],
+        ])
+        return f"llm-response:{xxhash.xxh3_128_hexdigest(payload)}"
+
+    def _count(self, model: Model, response):
+        with self._lock:
+            counter = self._misses if response is None else self._hits
+            counter[model.identifier] += 1
+
+    def get(self, model: Model, messages: list):
+        response = self._cache.get(self.key_for(model, messages))
+        self._count(model, response)
+        return response
+
+    def set(self, model: Model, messages: list, response: str):
+        self._cache.set(self.key_for(model, messages), response, model.response_cache_ttl)
+
+    async def aget(self, model: Model, messages: list):
+        response = await self._cache.aget(self.key_for(model, messages))
+        self._count(model, response)
+        return response
+
+    async def aset(self, model: Model, messages: list, response: str):
+        await self._cache.aset(self.key_for(model, messages), response, model.response_cache_ttl)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                identifier: {"hits": self._hits[identifier], "misses": self._misses[identifier]}
+                for identifier in self._hits.keys() | self._misses.keys()
+            }
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_ALIAS)
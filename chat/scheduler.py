@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
+from .models import Model
+
+# Seconds of traffic a token bucket may burst
+BURST_SECONDS = 10
+MAX_BACKOFF = 60
+MAX_RATE_LIMIT_RETRIES = 2
+ASYNC_POLL_INTERVAL = 0.05
+
+
+def rate_limit_retry_after(error: Exception):
+    """
+    Return the delay requested by a provider rate-limit (429) error, 0 when
+    it gives none, or None if `error` isn't a rate-limit error.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status_code != 429:
+        return None
+
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after", 0)), 0)
+    except (TypeError, ValueError):
+        # HTTP-date form, let the exponential backoff handle it
+        return 0
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.configure(per_minute)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+
+    def configure(self, per_minute: int):
+        self.per_minute = per_minute
+        self._rate = per_minute / 60
+        self._capacity = max(1.0, self._rate * BURST_SECONDS)
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def take(self):
+        self._tokens -= 1
+
+
+class _Limit:
+    """Concurrency cap, request rate and rate-limit backoff of a provider or model."""
+
+    def __init__(self):
+        self.max_concurrency = None
+        self.bucket = None
+        self.in_flight = 0
+        self.backoff = 0
+        self.backoff_until = 0
+
+    def configure(self, max_concurrency, requests_per_minute):
+        self.max_concurrency = max_concurrency
+        if not requests_per_minute:
+            self.bucket = None
+        elif self.bucket is None:
+            self.bucket = TokenBucket(requests_per_minute)
+        elif self.bucket.per_minute != requests_per_minute:
+            self.bucket.configure(requests_per_minute)
+
+    def wait_time(self, now: float):
+        """Seconds until a request may start, None if it must wait for a release."""
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return None
+        wait = max(self.backoff_until - now, 0)
+        if self.bucket is not None:
+            wait = max(wait, self.bucket.wait_time(now))
+        return wait
+
+    def start(self):
+        self.in_flight += 1
+        if self.bucket is not None:
+            self.bucket.take()
+
+    def rate_limited(self, now: float, retry_after: float):
+        self.backoff = min(max(self.backoff * 2, 1), MAX_BACKOFF)
+        self.backoff_until = max(self.backoff_until, now + max(retry_after, self.backoff))
+
+    def succeeded(self):
+        self.backoff /= 2
+
+
+def _process_share(limit):
+    """This process's share of a limit split across PROVIDER_LIMIT_PROCESSES processes."""
+    if not limit:
+        return limit
+    return max(limit // settings.PROVIDER_LIMIT_PROCESSES, 1)
+
+
+class _Ticket:
+    def __init__(self, provider: str, model_id: int, user_id):
+        self.provider = provider
+        self.model_id = model_id
+        self.user_id = user_id
+
+
+class ProviderScheduler:
+    """
+    Gates provider calls per provider (`ModelType.name`) and per model:
+    maximum concurrency, token-bucket request rates and exponential
+    backoff after 429 responses (honouring Retry-After). Waiting requests
+    of a provider are served round-robin across users, so a user with
+    many queued requests can't starve the others.
+
+    State is kept per process: each process enforces its share of the
+    configured limits, see PROVIDER_LIMIT_PROCESSES.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._providers = {}
+        self._models = {}
+        self._queues = {}
+
+    def _configure(self, model: Model):
+        provider = model.provider
+        provider_limit = self._providers.setdefault(provider.name, _Limit())
+        provider_limit.configure(
+            _process_share(provider.max_concurrency), _process_share(provider.requests_per_minute))
+        model_limit = self._models.setdefault(model.pk, _Limit())
+        model_limit.configure(
+            _process_share(model.max_concurrency), _process_share(model.requests_per_minute))
+
+    def _enqueue(self, model: Model, user_id) -> _Ticket:
+        ticket = _Ticket(model.provider.name, model.pk, user_id)
+        with self._cond:
+            self._configure(model)
+            queue = self._queues.setdefault(ticket.provider, OrderedDict())
+            queue.setdefault(user_id, deque()).append(ticket)
+        return ticket
+
+    def _ticket_wait(self, ticket: _Ticket, now: float):
+        waits = [
+            self._providers[ticket.provider].wait_time(now),
+            self._models[ticket.model_id].wait_time(now),
+        ]
+        if None in waits:
+            return None
+        return max(waits)
+
+    def _try_start(self, ticket: _Ticket):
+        """
+        Start `ticket` if it is the next eligible one in round-robin order.
+        Returns 0 when started, otherwise how long to wait (None: until notified).
+        """
+        now = time.monotonic()
+        queue = self._queues[ticket.provider]
+        for user_id, tickets in queue.items():
+            head = tickets[0]
+            wait = self._ticket_wait(head, now)
+            if head is ticket:
+                if wait != 0:
+                    return wait
+                break
+            if wait == 0:
+                # An earlier user goes first, wake it up
+                self._cond.notify_all()
+                return ASYNC_POLL_INTERVAL
+        else:
+            # Not at the head of its user's queue yet
+            return None
+
+        tickets.popleft()
+        if tickets:
+            queue.move_to_end(ticket.user_id)
+        else:
+            del queue[ticket.user_id]
+        self._providers[ticket.provider].start()
+        self._models[ticket.model_id].start()
+        # The next queued ticket may be able to start as well
+        self._cond.notify_all()
+        return 0
+
+    def _acquire(self, model: Model, user_id) -> _Ticket:
+        ticket = self._enqueue(model, user_id)
+        with self._cond:
+            while (wait := self._try_start(ticket)) != 0:
+                self._cond.wait(timeout=wait)
+        return ticket
+
+    async def _aacquire(self, model: Model, user_id) -> _Ticket:
+        ticket = self._enqueue(model, user_id)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_start(ticket)
+                if wait == 0:
+                    return ticket
+                await asyncio.sleep(min(wait or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL * 10))
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+
+    def _cancel(self, ticket: _Ticket):
+        with self._cond:
+            tickets = self._queues[ticket.provider].get(ticket.user_id)
+            if tickets and ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del self._queues[ticket.provider][ticket.user_id]
+            self._cond.notify_all()
+
+    def _release(self, ticket: _Ticket, error: Exception = None):
+        now = time.monotonic()
+        retry_after = rate_limit_retry_after(error) if error is not None else None
+        with self._cond:
+            for limit in (self._providers[ticket.provider], self._models[ticket.model_id]):
+                limit.in_flight -= 1
+                if retry_after is not None:
+                    limit.rate_limited(now, retry_after)
+                elif error is None:
+                    limit.succeeded()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model: Model, user_id):
+        ticket = self._acquire(model, user_id)
+        try:
+            yield
+        except BaseException as e:
+            self._release(ticket, e)
+            raise
+        self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, model: Model, user_id):
+        ticket = await self._aacquire(model, user_id)
+        try:
+            yield
+        except BaseException as e:
+            self._release(ticket, e)
+            raise
+        self._release(ticket)
+
+    def run(self, model: Model, user_id, call):
+        """Run `call()` in a slot, retrying after rate-limit backoffs."""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                with self.slot(model, user_id):
+                    return call()
+            except Exception as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES or rate_limit_retry_after(e) is None:
+                    raise
+
+    async def arun(self, model: Model, user_id, call):
+        """Await `call()` in a slot, retrying after rate-limit backoffs."""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                async with self.aslot(model, user_id):
+                    return await call()
+            except Exception as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES or rate_limit_retry_after(e) is None:
+                    raise
+
+
+provider_scheduler = ProviderScheduler()
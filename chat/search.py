@@ -0,0 +1,64 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, Q, Subquery
+from .models import Prompt, SEARCH_CONFIG
+from .pagination import decode_rank_cursor, encode_rank_cursor
+from .serializers import format_local_datetime, to_local
+
+HEADLINE_OPTIONS = {
+    "config": SEARCH_CONFIG,
+    "start_sel": "<mark>",
+    "stop_sel": "</mark>",
+    "max_words": 30,
+    "min_words": 10,
+    "max_fragments": 2,
+}
+
+
+def search_prompts(user, text: str, limit: int, cursor: str = None) -> dict:
+    """
+    Prompts in `user`'s threads matching `text` (web search syntax: quoted
+    phrases, `or`, `-word`), best match first, with highlighted snippets.
+    Matching goes through the GIN index on Prompt.search_vector.
+    Raises ValueError for malformed cursors.
+    """
+    query = SearchQuery(text, search_type="websearch", config=SEARCH_CONFIG)
+    rank = SearchRank(F("search_vector"), query)
+    prompts = Prompt.objects.filter(thread__user=user)
+    matches = prompts.filter(search_vector=query).annotate(rank=rank).order_by("-rank", "-id")
+    if cursor:
+        # Rows after the cursor row in (-rank, -id) order, its rank computed
+        # by the same expression so that ties compare equal
+        pk = decode_rank_cursor(cursor)
+        cursor_rank = Subquery(prompts.filter(id=pk).annotate(rank=rank).values("rank"))
+        matches = matches.filter(Q(rank__lt=cursor_rank) | Q(rank=cursor_rank, id__lt=pk))
+
+    # Postgres evaluates the costly ts_headline calls after the LIMIT,
+    # so snippets are only built for the rows returned
+    page = list(matches.annotate(
+        prompt_snippet=SearchHeadline("prompt", query, **HEADLINE_OPTIONS),
+        response_snippet=SearchHeadline("response", query, **HEADLINE_OPTIONS),
+    ).values(
+        "id", "thread_id", "thread__title", "created_at", "rank",
+        "prompt_snippet", "response_snippet",
+    )[:limit + 1])
+
+    has_next = len(page) > limit
+    page = page[:limit]
+    next_cursor = encode_rank_cursor(page[-1]["id"]) if has_next else None
+
+    return {
+        "next_cursor": next_cursor,
+        "has_next": has_next,
+        "results": [
+            {
+                "id": row["id"],
+                "thread": row["thread_id"],
+                "thread_title": row["thread__title"],
+                "created_at": format_local_datetime(to_local(row["created_at"])),
+                "rank": row["rank"],
+                "prompt": row["prompt_snippet"],
+                "response": row["response_snippet"],
+            }
+            for row in page
+        ],
+    }
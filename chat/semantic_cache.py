@@ -0,0 +1,220 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from django.conf import settings
+from langchain.embeddings import init_embeddings
+from .models import Model
+from .response_cache import ResponseCache
+
+KMEANS_ITERATIONS = 8
+ASSIGN_BLOCK_SIZE = 8192
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingsUnavailable(Exception):
+    """The embedding model can't be loaded, the semantic cache is off."""
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    In-process cosine-similarity index. Searches are brute force until the
+    index holds `ann_threshold` vectors, then an IVF structure (spherical
+    k-means over sqrt(n) lists, `nprobe` lists searched) is built and
+    rebuilt whenever the index doubles in size.
+    """
+
+    def __init__(self, ann_threshold: int, nprobe: int = 8):
+        self._ann_threshold = ann_threshold
+        self._nprobe = nprobe
+        self._vectors = None
+        self._values = []
+        self._size = 0
+        self._centroids = None
+        self._lists = None
+        self._built_size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, vector, value):
+        vector = _unit(vector)
+        if self._vectors is None:
+            self._vectors = np.empty((16, vector.shape[0]), dtype=np.float32)
+        elif self._size == len(self._vectors):
+            grown = np.empty((2 * len(self._vectors), self._vectors.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+        self._vectors[self._size] = vector
+        self._values.append(value)
+        if self._centroids is not None:
+            self._lists[int(np.argmax(self._centroids @ vector))].append(self._size)
+        self._size += 1
+
+        if self._size >= self._ann_threshold and self._size >= 2 * self._built_size:
+            self._build_ivf()
+
+    def search(self, vector) -> tuple[float, object]:
+        """Return (similarity, value) of the nearest neighbour."""
+        if not self._size:
+            return 0.0, None
+        vector = _unit(vector)
+
+        if self._centroids is None:
+            scores = self._vectors[:self._size] @ vector
+            best = int(np.argmax(scores))
+            return float(scores[best]), self._values[best]
+
+        probes = np.argsort(self._centroids @ vector)[-self._nprobe:]
+        ids = np.concatenate([np.asarray(self._lists[p], dtype=np.int64) for p in probes])
+        if not len(ids):
+            return 0.0, None
+        scores = self._vectors[ids] @ vector
+        best = int(np.argmax(scores))
+        return float(scores[best]), self._values[int(ids[best])]
+
+    def drop_oldest(self, count: int):
+        count = min(count, self._size)
+        self._vectors = self._vectors[count:self._size].copy()
+        self._values = self._values[count:]
+        self._size -= count
+        self._centroids = self._lists = None
+        self._built_size = 0
+        if self._size >= self._ann_threshold:
+            self._build_ivf()
+
+    def _build_ivf(self):
+        vectors = self._vectors[:self._size]
+        n_lists = max(int(np.sqrt(self._size)), 1)
+        rng = np.random.default_rng(0)
+
+        # Train centroids on a sample, then assign every vector
+        sample = vectors[rng.choice(self._size, size=min(self._size, 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assignment = np.concatenate([
+            np.argmax(vectors[start:start + ASSIGN_BLOCK_SIZE] @ centroids.T, axis=1)
+            for start in range(0, self._size, ASSIGN_BLOCK_SIZE)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=n_lists)
+        self._lists = [ids.tolist() for ids in np.split(order, np.cumsum(counts)[:-1])]
+        self._centroids = centroids
+        self._built_size = self._size
+
+
+class SemanticCache:
+    """
+    Cache of responses for paraphrased prompts, enabled per model by setting
+    `Model.semantic_cache_threshold`. Prompts are embedded with
+    `settings.SEMANTIC_CACHE_EMBEDDING_MODEL` and matched against earlier
+    prompts sent with the same (exactly matching) history, so a cached
+    answer is only reused in an equivalent conversation.
+    """
+
+    def __init__(self, embedding_model: str, max_entries: int, ann_threshold: int):
+        self._embedding_model = embedding_model
+        self._max_entries = max_entries
+        self._ann_threshold = ann_threshold
+        self._embeddings = None
+        self._embeddings_failed = False
+        self._indexes = OrderedDict()
+        self._entries = 0
+        self._hits = Counter()
+        self._misses = Counter()
+        self._lock = threading.Lock()
+
+    def is_enabled(self, model: Model) -> bool:
+        return model.semantic_cache_threshold is not None and not self._embeddings_failed
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            if self._embeddings_failed:
+                raise EmbeddingsUnavailable(self._embedding_model)
+            try:
+                self._embeddings = init_embeddings(self._embedding_model)
+            except Exception as e:
+                # e.g. sentence-transformers missing: warn once, not on every request
+                self._embeddings_failed = True
+                logger.warning(
+                    "Semantic cache disabled, cannot load embedding model %s: %s",
+                    self._embedding_model, e)
+                raise EmbeddingsUnavailable(self._embedding_model) from e
+        return self._embeddings
+
+    def embed(self, text: str):
+        return self._get_embeddings().embed_query(text)
+
+    async def aembed(self, text: str):
+        return await self._get_embeddings().aembed_query(text)
+
+    @staticmethod
+    def _partition(model: Model, history: list) -> tuple:
+        return model.pk, ResponseCache.key_for(model, history)
+
+    def lookup(self, model: Model, history: list, vector):
+        key = self._partition(model, history)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                similarity, response = index.search(vector)
+            else:
+                similarity, response = 0.0, None
+
+            if response is not None and similarity >= model.semantic_cache_threshold:
+                self._hits[model.identifier] += 1
+                return response
+            self._misses[model.identifier] += 1
+            return None
+
+    def add(self, model: Model, history: list, vector, response: str):
+        key = self._partition(model, history)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = VectorIndex(self._ann_threshold)
+            self._indexes.move_to_end(key)
+            index.add(vector, response)
+            self._entries += 1
+            self._evict()
+
+    def _evict(self):
+        while self._entries > self._max_entries:
+            key, index = next(iter(self._indexes.items()))
+            if len(self._indexes) > 1:
+                del self._indexes[key]
+                self._entries -= len(index)
+            else:
+                # A single hot partition, drop its oldest tenth
+                count = max(self._entries - self._max_entries, self._max_entries // 10)
+                index.drop_oldest(count)
+                self._entries = len(index)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                identifier: {"hits": self._hits[identifier], "misses": self._misses[identifier]}
+                for identifier in self._hits.keys() | self._misses.keys()
+            }
+
+
+semantic_cache = SemanticCache(
+    embedding_model=settings.SEMANTIC_CACHE_EMBEDDING_MODEL,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    ann_threshold=settings.SEMANTIC_CACHE_ANN_THRESHOLD,
+)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Model, Thread, Prompt
+from .models import Model, Thread, Prompt, GenerationJob
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
 from datetime import datetime
@@ -7,11 +7,17 @@ from zoneinfo import ZoneInfo
 from django.utils import timezone
 from django.conf import settings
 
+# Built once: constructing ZoneInfo per row is measurable on list endpoints
+LOCAL_TZ = ZoneInfo(settings.TIME_ZONE)
+UTC = ZoneInfo("UTC")
+
 
 class ModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Model
-        fields = "__all__"
+        # Public catalog (GET api/models needs no login): prices, limits,
+        # caching and fallback settings stay in the admin
+        fields = ["id", "name", "identifier", "provider", "api_environment_variable", "temperature"]
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
@@ -34,14 +40,11 @@ class ThreadSerializer(serializers.ModelSerializer):
         ret["model_identifier"] = instance.model.identifier
 
         # Timezone handling
-        user_tz = ZoneInfo(settings.TIME_ZONE)
-        utc = ZoneInfo("UTC")
-
         created_at = instance.created_at
         if timezone.is_naive(created_at):
-            created_at = created_at.replace(tzinfo=utc)
+            created_at = created_at.replace(tzinfo=UTC)
 
-        local_created_at = created_at.astimezone(user_tz)
+        local_created_at = created_at.astimezone(LOCAL_TZ)
         ret["created_at_date"] = datetime.combine(
             local_created_at.date(), datetime.min.time()
             # optionally just `.date().isoformat()` if you only want the date
@@ -53,7 +56,73 @@ class ThreadSerializer(serializers.ModelSerializer):
 class PromptSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prompt
-        fields = ["prompt", "response", "created_at"]
+        fields = ["id", "prompt", "response", "created_at"]
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = ["id", "thread", "status", "response", "error", "created_at", "finished_at"]
+
+
+# Fast read path for list endpoints: rows come from .values() and are turned
+# into the same dicts ThreadSerializer / PromptSerializer produce, without
+# DRF's per-field machinery.
+
+THREAD_LIST_FIELDS = (
+    "id", "title", "created_at", "model_id", "user_id",
+    "model__name", "model__provider__name", "model__identifier",
+)
+PROMPT_LIST_FIELDS = ("id", "prompt", "response", "created_at")
+
+
+def to_local(value: datetime, tz: ZoneInfo = LOCAL_TZ) -> datetime:
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(tz)
+
+
+def format_local_datetime(value: datetime) -> str:
+    """Same output as DRF's DateTimeField for an already localized value."""
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def serialize_thread_rows(rows, tz: ZoneInfo = LOCAL_TZ) -> list:
+    """
+    `rows` may carry a `created_at_date` already truncated to a date by the
+    database (in `tz`), otherwise it is computed here.
+    """
+    result = []
+    for row in rows:
+        local_created_at = to_local(row["created_at"], tz)
+        created_at_date = row.get("created_at_date") or local_created_at.date()
+        result.append({
+            "id": row["id"],
+            "title": row["title"],
+            "created_at": format_local_datetime(local_created_at),
+            "model": row["model_id"],
+            "user": row["user_id"],
+            "model_name": row["model__name"],
+            "model_type": row["model__provider__name"],
+            "model_identifier": row["model__identifier"],
+            "created_at_date": created_at_date.isoformat() + "T00:00:00",
+        })
+    return result
+
+
+def serialize_prompt_rows(rows) -> list:
+    return [
+        {
+            "id": row["id"],
+            "prompt": row["prompt"],
+            "response": row["response"],
+            "created_at": format_local_datetime(to_local(row["created_at"])),
+        }
+        for row in rows
+    ]
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
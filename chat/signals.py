@@ -0,0 +1,38 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Model, ModelType, ModelFallback, Thread
+from .aichat_factory import chat_model_pool
+from .history import history_cache
+from .catalog import invalidate_catalog
+from .metrics import record_query
+
+
+@receiver([post_save, post_delete], sender=Model)
+def invalidate_model_clients(sender, instance, **kwargs):
+    chat_model_pool.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ModelType)
+def invalidate_provider_clients(sender, instance, **kwargs):
+    # Pool keys embed the provider name, so drop everything on rename/delete
+    chat_model_pool.clear()
+
+
+@receiver(post_delete, sender=Thread)
+def invalidate_thread_history(sender, instance, **kwargs):
+    history_cache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Model)
+@receiver([post_save, post_delete], sender=ModelType)
+@receiver([post_save, post_delete], sender=ModelFallback)
+def invalidate_model_catalog(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Reconnections reuse the same wrapper object, add the hook once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import asyncio
+import numpy as np
+import orjson
+import threading
+import time
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .aichat_factory import ChatModelPool, LangChainModel, chat_model_pool
+from .catalog import CATALOG_CACHE_KEY, get_catalog
+from .fake_llm import FakeChatModel, FakeProviderError
+from .history import ConversationHistoryCache, history_cache
+from .jobs import claim_next_job, enqueue_job, requeue_stale_jobs, run_job
+from .models import GenerationJob, ModelType, Model, Thread, Prompt
+from .resilience import (
+    LATENCY_SAMPLES,
+    CircuitBreaker,
+    LatencyTracker,
+    acall_with_fallbacks,
+    call_with_fallbacks,
+)
+from .response_cache import ResponseCache
+from .scheduler import ProviderScheduler, TokenBucket, rate_limit_retry_after
+from .semantic_cache import EmbeddingsUnavailable, SemanticCache, VectorIndex
+from .serializers import THREAD_LIST_FIELDS, ThreadSerializer, serialize_thread_rows
+from .tokens import count_tokens, trim_history
+from .usage import roll_up_usage
+from .writes import PromptWriter
 
-# Create your tests here.
+
+def create_user(username="tester", **extra_fields) -> User:
+    return User.objects.create_user(
+        username=username, email=f"{username}@example.com", password="secret", **extra_fields)
+
+
+def create_thread(user: User, **model_fields) -> Thread:
+    """A thread of `user` on a new model of the "fake" provider."""
+    provider = ModelType.objects.create(name="fake")
+    model = Model.objects.create(
+        provider=provider, **{"name": "fake", "identifier": "fake", **model_fields})
+    return Thread.objects.create(title="thread", model=model, user=user)
+
+
+class ThreadTestCase(TestCase):
+    """Tests with `self.thread` of `self.user`, who is logged in on `self.client`."""
+
+    model_fields = {}
+
+    def setUp(self):
+        self.user = create_user()
+        self.thread = create_thread(self.user, **self.model_fields)
+        self.model = self.thread.model
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class ThreadListViewTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_threads(self, count):
+        for i in range(count):
+            provider = ModelType.objects.create(name=f"provider-{i}")
+            model = Model.objects.create(
+                name=f"model-{i}", identifier=f"model-{i}", provider=provider)
+            Thread.objects.create(title=f"thread-{i}", model=model, user=self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_threads(20)
+        cache.clear()
+        self.client.get("/api/models")
+
+        # COUNT/MAX aggregate (ETag and paginator) + one joined SELECT for the page
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/threads", {"pageSize": 20})
+
+        self.assertEqual(response.status_code, 200)
+        threads = [t for group in response.data["results"] for t in group["threads"]]
+        self.assertEqual(len(threads), 20)
+        self.assertEqual(
+            {t["model_type"] for t in threads}, {f"provider-{i}" for i in range(20)})
+
+    def test_cursor_pagination_walks_all_threads(self):
+        self.create_threads(5)
+
+        titles = []
+        params = {"pageSize": 2, "cursor": ""}
+        while True:
+            response = self.client.get("/api/threads", params)
+            self.assertEqual(response.status_code, 200)
+            titles += [t["title"] for group in response.data["results"] for t in group["threads"]]
+            if not response.data["has_next"]:
+                break
+            params["cursor"] = response.data["next_cursor"]
+
+        self.assertEqual(titles, [f"thread-{i}" for i in reversed(range(5))])
+        self.assertIsNone(response.data["next_cursor"])
+
+    def test_not_modified_until_a_thread_is_added(self):
+        self.create_threads(2)
+        etag = self.client.get("/api/threads")["ETag"]
+
+        response = self.client.get("/api/threads", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Thread.objects.create(title="new", model=Model.objects.first(), user=self.user)
+        response = self.client.get("/api/threads", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cursor_page_etag_needs_only_the_page_query(self):
+        self.create_threads(3)
+        cache.clear()
+        self.client.get("/api/models")
+        params = {"pageSize": 2, "cursor": ""}
+
+        with self.assertNumQueries(1):
+            etag = self.client.get("/api/threads", params)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/threads", params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Thread.objects.create(title="new", model=Model.objects.first(), user=self.user)
+        response = self.client.get("/api/threads", params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/threads", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_page_size(self):
+        for page_size in ("x", "0", "-1"):
+            response = self.client.get("/api/threads", {"pageSize": page_size, "cursor": ""})
+            self.assertEqual(response.status_code, 400, page_size)
+
+        self.create_threads(3)
+        response = self.client.get("/api/threads", {"pageSize": 10 ** 20, "cursor": ""})
+        self.assertEqual(response.status_code, 200)
+        with mock.patch("chat.views.MAX_PAGE_SIZE", 2):
+            response = self.client.get("/api/threads", {"pageSize": 10, "cursor": ""})
+        self.assertTrue(response.data["has_next"])
+
+        response = self.client.get("/api/threads", {"page": "x"})
+        self.assertEqual(response.data["current_page"], 1)
+
+    def test_row_serializer_matches_thread_serializer(self):
+        self.create_threads(3)
+        threads = Thread.objects.select_related("model__provider").order_by("id")
+
+        self.assertEqual(
+            serialize_thread_rows(threads.values(*THREAD_LIST_FIELDS)),
+            [dict(item) for item in ThreadSerializer(threads, many=True).data])
+
+    def test_groups_and_counts_by_requested_timezone(self):
+        self.create_threads(3)
+        # 03:00 UTC is still the previous day in New York, not in Madrid
+        Thread.objects.update(created_at=datetime(2025, 5, 2, 3, tzinfo=dt_timezone.utc))
+        Thread.objects.filter(title="thread-0").update(
+            created_at=datetime(2025, 5, 1, 12, tzinfo=dt_timezone.utc))
+
+        response = self.client.get("/api/threads")
+        self.assertEqual([group["date"] for group in response.data["results"]],
+                         ["2025-05-01T00:00:00"])
+
+        response = self.client.get("/api/threads", {"tz": "Europe/Madrid"})
+        self.assertEqual([group["date"] for group in response.data["results"]],
+                         ["2025-05-02T00:00:00", "2025-05-01T00:00:00"])
+
+        response = self.client.get("/api/threads/dates", {"tz": "Europe/Madrid"})
+        self.assertEqual(response.data, [
+            {"date": "2025-05-02T00:00:00", "count": 2},
+            {"date": "2025-05-01T00:00:00", "count": 1},
+        ])
+
+        response = self.client.get("/api/threads/dates", {"tz": "Nowhere/City"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PromptHistoryTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.prompts = [
+            Prompt.objects.create(thread=self.thread, prompt=f"q{i}", response=f"a{i}")
+            for i in range(5)
+        ]
+        self.url = f"/api/threads/{self.thread.id}/prompts"
+
+    def test_pages_backwards_from_newest(self):
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q3", "q4"])
+
+        response = self.client.get(
+            self.url, {"limit": 2, "before": response.data["next_cursor"]})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q1", "q2"])
+
+        response = self.client.get(
+            self.url, {"limit": 2, "before": response.data["next_cursor"]})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q0"])
+        self.assertFalse(response.data["has_next"])
+
+    def test_since_returns_newer_prompts(self):
+        response = self.client.get(self.url, {"limit": 10, "since": self.prompts[2].id})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q3", "q4"])
+
+    def test_without_limit_returns_full_history(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+
+    def test_since_without_limit_is_paged(self):
+        response = self.client.get(self.url, {"since": self.prompts[3].id})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q4"])
+
+    def test_rejects_invalid_limit(self):
+        for limit in ("x", "0", "-1"):
+            response = self.client.get(self.url, {"limit": limit})
+            self.assertEqual(response.status_code, 400, limit)
+
+        response = self.client.get(self.url, {"limit": 10 ** 20})
+        self.assertEqual(len(response.data["results"]), 5)
+        with mock.patch("chat.views.MAX_PROMPT_PAGE_SIZE", 2):
+            response = self.client.get(self.url, {"limit": 1000000})
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q3", "q4"])
+
+    def test_not_modified_until_a_prompt_is_added(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Prompt.objects.create(thread=self.thread, prompt="q5", response="a5")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_etag_changes_when_a_prompt_is_added(self):
+        with self.assertNumQueries(1):
+            etag = self.client.get(self.url, {"limit": 2})["ETag"]
+        response = self.client.get(self.url, {"limit": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Prompt.objects.create(thread=self.thread, prompt="q5", response="a5")
+        response = self.client.get(self.url, {"limit": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([p["prompt"] for p in response.data["results"]], ["q4", "q5"])
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get(f"/api/threads/{self.thread.id}/export")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([orjson.loads(line)["prompt"] for line in lines],
+                         [f"q{i}" for i in range(5)])
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await AsyncClient().get(
+            f"/api/threads/{self.thread.id}/export", headers={"Authorization": f"Bearer {token}"})
+        self.assertTrue(response.is_async)
+
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual([orjson.loads(line)["prompt"] for line in lines],
+                         [f"q{i}" for i in range(5)])
+
+
+class HistoryCacheTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ConversationHistoryCache(max_threads=10, max_chars=10_000)
+
+    def contents(self, messages):
+        return [message.content for message in messages]
+
+    def test_only_new_prompts_are_read(self):
+        for i in range(3):
+            Prompt.objects.create(thread=self.thread, prompt=f"q{i}", response=f"a{i}")
+        Prompt.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+        self.cache.get_history(self.thread)
+
+        with self.assertNumQueries(1):
+            messages, token_counts = self.cache.get_history(self.thread)
+        self.assertEqual(self.contents(messages), ["q0", "a0", "q1", "a1", "q2", "a2"])
+        self.assertEqual(len(token_counts), 3)
+
+        Prompt.objects.create(thread=self.thread, prompt="q3", response="a3")
+        messages, _ = self.cache.get_history(self.thread)
+        self.assertEqual(self.contents(messages)[-2:], ["q3", "a3"])
+
+    def test_recent_prompts_committed_out_of_order_are_not_skipped(self):
+        Prompt.objects.create(id=10, thread=self.thread, prompt="q10", response="a10")
+        self.assertEqual(self.contents(self.cache.get_history(self.thread)[0]), ["q10", "a10"])
+
+        # A lower id committed after a higher one (e.g. by the job worker)
+        Prompt.objects.create(id=5, thread=self.thread, prompt="q5", response="a5")
+        messages, _ = self.cache.get_history(self.thread)
+        self.assertEqual(self.contents(messages), ["q10", "a10", "q5", "a5"])
+
+    def test_evicts_least_recently_used_threads(self):
+        cache = ConversationHistoryCache(max_threads=1, max_chars=10_000)
+        other = Thread.objects.create(title="other", model=self.thread.model, user=self.thread.user)
+        cache.get_history(self.thread)
+        cache.get_history(other)
+        self.assertEqual(list(cache._entries), [other.id])
+
+
+class ContextBudgetTests(TestCase):
+    def test_trim_history_keeps_the_newest_turns_that_fit(self):
+        messages = ["q0", "a0", "q1", "a1", "q2", "a2"]
+        self.assertEqual(trim_history(messages, [5, 3, 4], None), messages)
+        self.assertEqual(trim_history(messages, [5, 3, 4], 7), ["q1", "a1", "q2", "a2"])
+        self.assertEqual(trim_history(messages, [5, 3, 4], 11), ["q1", "a1", "q2", "a2"])
+        self.assertEqual(trim_history(messages, [5, 3, 4], 12), messages)
+        # The newest turn alone doesn't fit
+        self.assertEqual(trim_history(messages, [5, 3, 4], 3), [])
+
+    def test_budget_leaves_room_for_the_new_prompt(self):
+        thread = create_thread(create_user())
+        model = thread.model
+        for i in range(3):
+            Prompt.objects.create(
+                thread=thread, prompt=f"q{i}", response=f"a{i}", token_count=10)
+        history_cache.clear()
+        self.addCleanup(history_cache.clear)
+
+        prompt = "How long is the context?"
+        model.context_token_budget = count_tokens(prompt) + 25
+        aichat_model = LangChainModel(thread)
+        aichat_model._add_user_prompt(prompt)
+
+        self.assertEqual([message.content for message in aichat_model._messages],
+                         ["q1", "a1", "q2", "a2", prompt])
+        self.assertEqual(aichat_model._input_tokens, 20 + count_tokens(prompt))
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.model = Model(pk=1, name="fake", identifier="fake", temperature=0.2,
+                           response_cache_ttl=60, provider=ModelType(name="fake"))
+        self.cache = ResponseCache("default")
+        cache.clear()
+
+    def test_key_ignores_whitespace_differences(self):
+        key = ResponseCache.key_for(self.model, [HumanMessage(content="What  is\nDjango? ")])
+        self.assertEqual(key, ResponseCache.key_for(self.model, [HumanMessage(content="What is Django?")]))
+        self.assertNotEqual(key, ResponseCache.key_for(self.model, [HumanMessage(content="What is django?")]))
+        self.assertNotEqual(key, ResponseCache.key_for(self.model, [AIMessage(content="What is Django?")]))
+
+        self.model.temperature = 0.7
+        self.assertNotEqual(key, ResponseCache.key_for(self.model, [HumanMessage(content="What is Django?")]))
+
+    def test_entries_expire_after_the_model_ttl(self):
+        messages = [HumanMessage(content="hi")]
+        self.cache.set(self.model, messages, "hello")
+        self.assertEqual(self.cache.get(self.model, messages), "hello")
+
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get(self.model, messages))
+        self.assertEqual(self.cache.stats(), {"fake": {"hits": 1, "misses": 1}})
+
+    def test_disabled_without_ttl(self):
+        self.model.response_cache_ttl = None
+        self.assertFalse(ResponseCache.is_enabled(self.model))
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.model = Model(pk=1, name="fake", identifier="fake", semantic_cache_threshold=0.9,
+                           provider=ModelType(name="fake"))
+
+    def test_index_finds_the_nearest_vector(self):
+        index = VectorIndex(ann_threshold=1000)
+        index.add([1, 0, 0], "x")
+        index.add([0, 1, 0], "y")
+        similarity, value = index.search([0.1, 2, 0])
+        self.assertEqual(value, "y")
+        self.assertAlmostEqual(similarity, 2 / np.sqrt(4.01), places=5)
+
+    def test_index_switches_to_ivf_past_the_threshold(self):
+        vectors = np.random.default_rng(1).normal(size=(200, 16))
+        index = VectorIndex(ann_threshold=64)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+
+        self.assertIsNotNone(index._centroids)
+        for i in (0, 99, 199):
+            similarity, value = index.search(vectors[i])
+            self.assertEqual(value, i)
+            self.assertAlmostEqual(similarity, 1, places=5)
+
+    def test_drop_oldest(self):
+        index = VectorIndex(ann_threshold=1000)
+        for i in range(5):
+            index.add([1, i, 0], i)
+        index.drop_oldest(2)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search([1, 0, 0])[1], 2)
+
+    def test_lookup_needs_the_threshold_and_same_history(self):
+        cache = SemanticCache("unused", max_entries=10, ann_threshold=1000)
+        history = [HumanMessage(content="q"), AIMessage(content="a")]
+        cache.add(self.model, history, [1, 0], "cached")
+
+        self.assertEqual(cache.lookup(self.model, history, [1, 0.1]), "cached")
+        self.assertIsNone(cache.lookup(self.model, history, [1, 1]))
+        self.assertIsNone(cache.lookup(self.model, [], [1, 0.1]))
+
+    def test_evicts_least_recently_used_partitions_first(self):
+        cache = SemanticCache("unused", max_entries=3, ann_threshold=1000)
+        old, recent = [HumanMessage(content="old")], [HumanMessage(content="recent")]
+        cache.add(self.model, old, [1, 0], "old")
+        cache.add(self.model, recent, [1, 0], "recent")
+        cache.add(self.model, recent, [0, 1], "recent 2")
+        cache.add(self.model, recent, [1, 1], "recent 3")
+
+        self.assertIsNone(cache.lookup(self.model, old, [1, 0]))
+        self.assertEqual(cache.lookup(self.model, recent, [1, 0]), "recent")
+
+        # A single partition over the limit loses its oldest entries
+        cache.add(self.model, recent, [-1, 0], "recent 4")
+        self.assertIsNone(cache.lookup(self.model, recent, [1, 0]))
+        self.assertEqual(cache._entries, 3)
+
+    @mock.patch("chat.semantic_cache.init_embeddings", side_effect=ImportError("sentence_transformers"))
+    def test_disables_itself_once_the_embedding_model_fails_to_load(self, init_embeddings):
+        cache = SemanticCache("unused", max_entries=10, ann_threshold=1000)
+        with self.assertLogs("chat.semantic_cache", "WARNING") as logs:
+            with self.assertRaises(EmbeddingsUnavailable):
+                cache.embed("q")
+        self.assertEqual(len(logs.records), 1)
+        self.assertFalse(cache.is_enabled(self.model))
+
+        with self.assertRaises(EmbeddingsUnavailable):
+            cache.embed("q")
+        init_embeddings.assert_called_once()
+
+
+class ModelCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        provider = ModelType.objects.create(name="fake")
+        self.model = Model.objects.create(name="fake", identifier="fake", provider=provider)
+        self.client = APIClient()
+
+    def test_warm_catalog_needs_no_queries(self):
+        response = self.client.get("/api/models")
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/models")
+            self.client.get(f"/api/models/{self.model.id}")
+        self.assertEqual(response.data[0]["model_type"], "fake")
+
+    def test_exposes_only_public_fields(self):
+        response = self.client.get("/api/models")
+        self.assertEqual(set(response.data[0]), {
+            "id", "name", "identifier", "provider", "api_environment_variable",
+            "temperature", "model_type",
+        })
+
+    def test_not_modified_until_catalog_changes(self):
+        etag = self.client.get("/api/models")["ETag"]
+
+        response = self.client.get("/api/models", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.model.name = "renamed"
+        self.model.save()
+        response = self.client.get("/api/models", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["name"], "renamed")
+
+    def test_model_added_by_another_process_is_found(self):
+        stale = get_catalog()
+        model = Model.objects.create(name="new", identifier="new", provider=self.model.provider)
+        # This process's cache was not invalidated
+        cache.set(CATALOG_CACHE_KEY, stale)
+
+        response = self.client.get(f"/api/models/{model.id}")
+        self.assertEqual(response.data["name"], "new")
+        self.assertEqual(len(self.client.get("/api/models").data), 2)
+        self.assertEqual(self.client.get(f"/api/models/{model.id + 1}").status_code, 404)
+
+
+class PromptWriteTests(ThreadTestCase):
+    @mock.patch("chat.views.LangChainModel")
+    def test_exchange_is_a_single_insert(self, langchain_model):
+        langchain_model.return_value.get_response.return_value = "answer"
+        langchain_model.return_value.usage = None
+
+        # SELECT of the thread + INSERT of the prompt row
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                f"/api/threads/{self.thread.id}/response", {"user_prompt": "question"})
+
+        self.assertEqual(response.data, {"response": "answer"})
+        prompt = Prompt.objects.get(thread=self.thread)
+        self.assertEqual(prompt.response, "answer")
+        self.assertIsNotNone(prompt.token_count)
+
+    def test_missing_thread(self):
+        response = self.client.post("/api/threads/0/response", {"user_prompt": "question"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_buffered_writer_bulk_inserts_on_flush(self):
+        writer = PromptWriter(buffer_size=10, flush_interval=3600)
+        for i in range(3):
+            writer.save(self.thread, f"q{i}", f"a{i}")
+        self.assertFalse(Prompt.objects.exists())
+
+        # Existing threads + one INSERT
+        with self.assertNumQueries(2):
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(
+            list(Prompt.get_prompts_by_thread(self.thread.id).values_list("prompt", flat=True)),
+            ["q0", "q1", "q2"])
+        self.assertFalse(Prompt.objects.filter(token_count=None).exists())
+
+    def test_flush_skips_rows_of_deleted_threads(self):
+        deleted = Thread.objects.create(title="deleted", model=self.model, user=self.user)
+        writer = PromptWriter(buffer_size=10, flush_interval=3600)
+        writer.save(self.thread, "q0", "a0")
+        writer.save(deleted, "q1", "a1")
+        writer.save(self.thread, "q2", "a2")
+        deleted.delete()
+
+        with self.assertLogs("chat.writes", "WARNING"):
+            self.assertEqual(writer.flush(), 2)
+        self.assertEqual(list(Prompt.objects.order_by("id").values_list("prompt", flat=True)),
+                         ["q0", "q2"])
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(
+            status_code=429, headers={"retry-after": retry_after} if retry_after else {})
+
+
+class ProviderSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = ProviderScheduler()
+
+    def make_model(self, pk=1, **provider_limits):
+        return Model(pk=pk, name="fake", identifier=f"fake-{pk}",
+                     provider=ModelType(name="fake", **provider_limits))
+
+    def queued(self) -> int:
+        with self.scheduler._cond:
+            return sum(len(tickets) for queue in self.scheduler._queues.values()
+                       for tickets in queue.values())
+
+    def start_waiting(self, model, user_id, call):
+        """Start a thread entering a slot and return once its request is queued."""
+        queued = self.queued()
+        thread = threading.Thread(target=self.scheduler.run, args=(model, user_id, call))
+        thread.start()
+        while self.queued() == queued:
+            time.sleep(0.001)
+        return thread
+
+    def test_concurrency_cap(self):
+        model = self.make_model(max_concurrency=2)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def call():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        threads = [threading.Thread(target=self.scheduler.run, args=(model, i, call))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+    @override_settings(PROVIDER_LIMIT_PROCESSES=2)
+    def test_limits_are_split_across_processes(self):
+        model = self.make_model(max_concurrency=5, requests_per_minute=1)
+        self.scheduler._configure(model)
+        limit = self.scheduler._providers["fake"]
+        self.assertEqual(limit.max_concurrency, 2)
+        self.assertEqual(limit.bucket.per_minute, 1)
+
+    def test_waiting_requests_are_served_round_robin(self):
+        model = self.make_model(max_concurrency=1)
+        order = []
+        holder = self.scheduler._acquire(model, "holder")
+
+        threads = [
+            self.start_waiting(model, user_id, lambda user_id=user_id: order.append(user_id))
+            for user_id in ("a", "a", "a", "b")
+        ]
+        self.scheduler._release(holder)
+        for thread in threads:
+            thread.join()
+        # "b" queued last but doesn't wait for all of "a"'s requests
+        self.assertEqual(order, ["a", "b", "a", "a"])
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(per_minute=60)
+        now = bucket._updated
+        # A burst of BURST_SECONDS worth of requests, then one per second
+        for _ in range(10):
+            self.assertEqual(bucket.wait_time(now), 0)
+            bucket.take()
+        self.assertAlmostEqual(bucket.wait_time(now), 1)
+        self.assertEqual(bucket.wait_time(now + 1), 0)
+
+    def test_rate_limited_calls_back_off_and_retry(self):
+        model = self.make_model()
+        calls = []
+
+        def call():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RateLimitError(retry_after="0.2")
+            return "ok"
+
+        self.assertEqual(self.scheduler.run(model, 1, call), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+        # Backoff doubles from 1s without Retry-After and halves on success
+        self.assertEqual(self.scheduler._providers["fake"].backoff, 0.5)
+
+    def test_retry_after_parsing(self):
+        self.assertEqual(rate_limit_retry_after(RateLimitError("3")), 3)
+        self.assertEqual(rate_limit_retry_after(RateLimitError("Wed, 21 Oct 2015 07:28:00 GMT")), 0)
+        self.assertEqual(rate_limit_retry_after(RateLimitError()), 0)
+        self.assertIsNone(rate_limit_retry_after(ValueError()))
+
+    def test_gives_up_after_repeated_rate_limits(self):
+        def call():
+            raise RateLimitError(retry_after="0")
+
+        with mock.patch("chat.scheduler.MAX_BACKOFF", 0.01):
+            with self.assertRaises(RateLimitError):
+                self.scheduler.run(self.make_model(), 1, call)
+
+
+class FallbackTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        for name, value in (("circuit_breaker", self.breaker),
+                            ("latency_tracker", LatencyTracker(LATENCY_SAMPLES))):
+            patcher = mock.patch(f"chat.resilience.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def make_models(self, *fakes, hedge_delay=None):
+        self.fakes = {}
+        models = []
+        for pk, fake in enumerate(fakes, start=1):
+            self.fakes[pk] = fake
+            models.append(Model(pk=pk, name=f"m{pk}", identifier=f"m{pk}", hedge_delay=hedge_delay,
+                                provider=ModelType(name=f"provider-{pk}")))
+        return models
+
+    def call(self, model):
+        self.calls.append(model.pk)
+        self.fakes[model.pk].invoke("hi")
+        return model.pk
+
+    def test_failures_move_on_in_fallback_order(self):
+        models = self.make_models(
+            FakeChatModel(failure_rate=1), FakeChatModel(failure_rate=1), FakeChatModel())
+        self.assertEqual(call_with_fallbacks(models, self.call), 3)
+        self.assertEqual(self.calls, [1, 2, 3])
+
+    def test_raises_the_last_error_when_all_fail(self):
+        models = self.make_models(FakeChatModel(failure_rate=1), FakeChatModel(failure_rate=1))
+        with self.assertRaises(FakeProviderError):
+            call_with_fallbacks(models, self.call)
+
+    def test_slow_call_is_hedged(self):
+        models = self.make_models(
+            FakeChatModel(latency=1), FakeChatModel(), hedge_delay=0.05)
+        started = time.monotonic()
+        self.assertEqual(call_with_fallbacks(models, self.call), 2)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    async def test_async_hedging_cancels_the_losing_call(self):
+        models = self.make_models(
+            FakeChatModel(latency=5), FakeChatModel(), hedge_delay=0.05)
+        cancelled = []
+
+        async def call(model):
+            try:
+                await self.fakes[model.pk].ainvoke("hi")
+            except asyncio.CancelledError:
+                cancelled.append(model.pk)
+                raise
+            return model.pk
+
+        self.assertEqual(await acall_with_fallbacks(models, call), 2)
+        await asyncio.sleep(0.01)
+        self.assertEqual(cancelled, [1])
+
+    def test_circuit_opens_and_resets(self):
+        models = self.make_models(FakeChatModel(failure_rate=1), FakeChatModel())
+        for _ in range(2):
+            call_with_fallbacks(models, self.call)
+        self.assertTrue(self.breaker.is_open("provider-1"))
+
+        # The open provider is skipped
+        self.calls.clear()
+        call_with_fallbacks(models, self.call)
+        self.assertEqual(self.calls, [2])
+
+        # Let through again after the timeout, a single failure reopens it
+        time.sleep(0.1)
+        self.calls.clear()
+        call_with_fallbacks(models, self.call)
+        self.assertEqual(self.calls, [1, 2])
+        self.assertTrue(self.breaker.is_open("provider-1"))
+
+    def test_success_closes_the_circuit(self):
+        self.breaker.record_failure("provider-1")
+        self.breaker.record_failure("provider-1")
+        self.breaker.record_success("provider-1")
+        self.assertFalse(self.breaker.is_open("provider-1"))
+
+
+class AsyncViewTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = AccessToken.for_user(self.user)
+        history_cache.clear()
+        self.addCleanup(history_cache.clear)
+        patcher = mock.patch("chat.aichat_factory.chat_model_pool.get")
+        patcher.start().return_value = FakeListChatModel(responses=["hello there"])
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, data, token=None):
+        return AsyncClient().post(url, data, content_type="application/json",
+                                  headers={"Authorization": f"Bearer {token or self.token}"})
+
+    async def test_answers_and_saves_the_exchange(self):
+        response = await self.post(
+            f"/api/async/threads/{self.thread.id}/response", {"user_prompt": "hi"})
+        self.assertEqual(response.json(), {"response": "hello there"})
+        prompt = await Prompt.objects.aget(thread=self.thread)
+        self.assertEqual((prompt.prompt, prompt.response), ("hi", "hello there"))
+
+    async def test_requires_a_prompt(self):
+        for body in ({}, {"user_prompt": ""}, "[1]", "not json"):
+            response = await self.post(f"/api/async/threads/{self.thread.id}/response", body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json(), {"error": "Prompt is required"})
+        self.assertFalse(await Prompt.objects.aexists())
+
+    async def test_other_users_thread_is_not_found(self):
+        other = await sync_to_async(create_user)("other")
+        token = await sync_to_async(AccessToken.for_user)(other)
+        response = await self.post(
+            f"/api/async/threads/{self.thread.id}/response", {"user_prompt": "hi"}, token)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Prompt.objects.aexists())
+
+    async def read_events(self, response):
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for message in body.split("\n\n")[:-1]:
+            lines = message.split("\n")
+            event = lines[0].removeprefix("event: ") if len(lines) == 2 else None
+            events.append((event, orjson.loads(lines[-1].removeprefix("data: "))))
+        return events
+
+    async def test_streams_tokens_then_saves_the_exchange(self):
+        response = await self.post(
+            f"/api/threads/{self.thread.id}/response/stream", {"user_prompt": "hi"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        events = await self.read_events(response)
+        self.assertEqual("".join(data["token"] for event, data in events[:-1] if event is None),
+                         "hello there")
+        self.assertEqual(events[-1], ("done", {"response": "hello there"}))
+        prompt = await Prompt.objects.aget(thread=self.thread)
+        self.assertEqual((prompt.prompt, prompt.response), ("hi", "hello there"))
+
+    async def test_stream_requires_a_prompt_and_own_thread(self):
+        url = f"/api/threads/{self.thread.id}/response/stream"
+        response = await self.post(url, {})
+        self.assertEqual(response.status_code, 400)
+
+        other = await sync_to_async(create_user)("other")
+        token = await sync_to_async(AccessToken.for_user)(other)
+        response = await self.post(url, {"user_prompt": "hi"}, token)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Prompt.objects.aexists())
+
+    async def test_start_thread(self):
+        response = await self.post(f"/api/async/threads/{self.model.id}/start", {"title": "new"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["thread"]["title"], "new")
+
+        response = await self.post(f"/api/async/threads/{self.model.id}/start", [])
+        self.assertEqual(response.status_code, 400)
+
+
+class GenerationJobTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        # The job endpoint is a plain async view, force_authenticate doesn't reach it
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_rejects_invalid_wait(self):
+        job = enqueue_job(self.thread, self.user, "hi")
+        for wait in ("nan", "inf", "-1", "soon"):
+            response = self.client.get(f"/api/jobs/{job.id}", {"wait": wait})
+            self.assertEqual(response.status_code, 400, wait)
+
+        response = self.client.get(f"/api/jobs/{job.id}", {"wait": "0"})
+        self.assertEqual(response.json()["status"], GenerationJob.PENDING)
+
+    def test_queueing_requires_a_prompt(self):
+        response = self.client.post(f"/api/threads/{self.thread.id}/response?async=1", {})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+
+        response = self.client.post(
+            f"/api/threads/{self.thread.id}/response?async=1", {"user_prompt": "hi"})
+        self.assertEqual(response.status_code, 202)
+
+    def test_claims_the_oldest_pending_job(self):
+        first = enqueue_job(self.thread, self.user, "q0")
+        second = enqueue_job(self.thread, self.user, "q1")
+
+        job = claim_next_job()
+        self.assertEqual(job.id, first.id)
+        first.refresh_from_db()
+        self.assertEqual(first.status, GenerationJob.RUNNING)
+        self.assertIsNotNone(first.started_at)
+
+        self.assertEqual(claim_next_job().id, second.id)
+        self.assertIsNone(claim_next_job())
+
+    @mock.patch("chat.jobs.LangChainModel")
+    def test_finished_job_writes_its_prompt(self, langchain_model):
+        langchain_model.return_value.get_response.return_value = "answer"
+        langchain_model.return_value.usage = None
+        enqueue_job(self.thread, self.user, "hi")
+
+        run_job(claim_next_job())
+        job = GenerationJob.objects.get()
+        self.assertEqual((job.status, job.response), (GenerationJob.DONE, "answer"))
+        self.assertEqual(Prompt.objects.get(thread=self.thread).response, "answer")
+
+    @mock.patch("chat.jobs.LangChainModel")
+    def test_prompt_is_not_written_without_the_finished_job(self, langchain_model):
+        langchain_model.return_value.get_response.return_value = "answer"
+        langchain_model.return_value.usage = None
+        job = enqueue_job(self.thread, self.user, "hi")
+
+        with mock.patch.object(GenerationJob, "save", side_effect=DatabaseError("gone")):
+            with self.assertRaises(DatabaseError):
+                run_job(job)
+        self.assertFalse(Prompt.objects.exists())
+
+    @mock.patch("chat.jobs.LangChainModel")
+    def test_provider_error_fails_the_job(self, langchain_model):
+        langchain_model.return_value.get_response.side_effect = Exception("provider down")
+        enqueue_job(self.thread, self.user, "hi")
+
+        run_job(claim_next_job())
+        job = GenerationJob.objects.get()
+        self.assertEqual((job.status, job.error), (GenerationJob.FAILED, "provider down"))
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Prompt.objects.exists())
+
+    def test_requeues_stale_running_jobs(self):
+        stale = enqueue_job(self.thread, self.user, "q0")
+        recent = enqueue_job(self.thread, self.user, "q1")
+        GenerationJob.objects.update(status=GenerationJob.RUNNING, started_at=timezone.now())
+        GenerationJob.objects.filter(id=stale.id).update(
+            started_at=timezone.now() - timedelta(minutes=20))
+
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=10)), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, stale.started_at), (GenerationJob.PENDING, None))
+        self.assertEqual(recent.status, GenerationJob.RUNNING)
+        self.assertEqual(claim_next_job().id, stale.id)
+
+
+@mock.patch("chat.aichat_factory.build_chat_model", side_effect=lambda model: object())
+class ChatModelPoolTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        for pooled_cache in (chat_model_pool, history_cache):
+            pooled_cache.clear()
+            self.addCleanup(pooled_cache.clear)
+
+    def make_model(self, pk):
+        return Model(pk=pk, name=f"m{pk}", identifier=f"m{pk}", provider=ModelType(name="fake"))
+
+    def test_langchain_models_reuse_the_client(self, build_chat_model):
+        LangChainModel(self.thread)
+        LangChainModel(self.thread)
+        build_chat_model.assert_called_once()
+
+    def test_evicts_least_recently_used_clients(self, build_chat_model):
+        pool = ChatModelPool(maxsize=2, ttl=60)
+        first, second, third = (self.make_model(pk) for pk in (1, 2, 3))
+        client = pool.get(first)
+        pool.get(second)
+        pool.get(first)
+        pool.get(third)
+        self.assertEqual(build_chat_model.call_count, 3)
+
+        self.assertIs(pool.get(first), client)
+        pool.get(second)
+        self.assertEqual(build_chat_model.call_count, 4)
+
+    def test_clients_expire(self, build_chat_model):
+        pool = ChatModelPool(maxsize=2, ttl=0.05)
+        model = self.make_model(1)
+        client = pool.get(model)
+        time.sleep(0.1)
+        self.assertIsNot(pool.get(model), client)
+
+    def test_model_and_provider_changes_invalidate_clients(self, build_chat_model):
+        client = chat_model_pool.get(self.model)
+        self.assertIs(chat_model_pool.get(self.model), client)
+
+        # Saved without changing its pool key
+        self.model.save()
+        self.assertIsNot(chat_model_pool.get(self.model), client)
+
+        client = chat_model_pool.get(self.model)
+        self.model.provider.save()
+        self.assertIsNot(chat_model_pool.get(self.model), client)
+
+        client = chat_model_pool.get(self.model)
+        Model.objects.get(pk=self.model.pk).delete()
+        self.assertIsNot(chat_model_pool.get(self.model), client)
+
+        client = chat_model_pool.get(self.model)
+        self.model.provider.delete()
+        self.assertIsNot(chat_model_pool.get(self.model), client)
+
+
+class FakeChatModelTests(TestCase):
+    def test_answers_are_deterministic(self):
+        first = FakeChatModel(response_tokens=8).invoke("hello")
+        second = FakeChatModel(response_tokens=8).invoke("hello")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(first.content.split()), 8)
+        self.assertEqual(first.usage_metadata["output_tokens"], 8)
+        self.assertNotEqual(first.content, FakeChatModel(response_tokens=8).invoke("bye").content)
+
+    def test_stream_ends_with_usage(self):
+        chunks = list(FakeChatModel(response_tokens=5).stream("hello"))
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(chunks[-1].usage_metadata["output_tokens"], 5)
+
+    def test_failure_rate(self):
+        with self.assertRaises(FakeProviderError):
+            FakeChatModel(failure_rate=1).invoke("hello")
+
+    @override_settings(FAKE_LLM_LATENCY=0, FAKE_LLM_TOKENS_PER_SECOND=0, FAKE_LLM_FAILURE_RATE=0)
+    def test_fake_provider_answers_endpoints(self):
+        user = create_user()
+        thread = create_thread(user, identifier="fake-model")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        chat_model_pool.clear()
+        self.addCleanup(chat_model_pool.clear)
+        response = client.post(f"/api/threads/{thread.id}/response", {"user_prompt": "hi"})
+        self.assertEqual(response.data, {"response": FakeChatModel().invoke("hi").content})
+        self.assertEqual(Prompt.objects.get().output_tokens, 40)
+
+
+class RequestMetricsTests(ThreadTestCase):
+    model_fields = {"identifier": "fake-model"}
+
+    def test_server_timing_counts_queries(self):
+        response = self.client.get(f"/api/threads/{self.thread.id}/prompts")
+        self.assertRegex(response["Server-Timing"], r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+    @mock.patch("chat.aichat_factory.chat_model_pool.get")
+    def test_provider_calls_are_exported(self, get_chat_model):
+        get_chat_model.return_value = FakeListChatModel(responses=["hello there"])
+
+        response = self.client.post(
+            f"/api/threads/{self.thread.id}/response", {"user_prompt": "hi"})
+        self.assertEqual(response.data, {"response": "hello there"})
+        self.assertIn("llm;dur=", response["Server-Timing"])
+
+        body = self.client.get("/metrics").content.decode()
+        labels = 'endpoint="api/threads/<int:thread_id>/response",provider="fake",model="fake-model"'
+        self.assertIn(f"llm_request_duration_seconds_count{{{labels}}}", body)
+        self.assertIn(f'llm_tokens_total{{{labels},kind="output"}}', body)
+
+
+class HealthTests(TestCase):
+    def test_reports_the_database(self):
+        response = APIClient().get("/api/health")
+        self.assertEqual(response.data, {"database": "ok"})
+
+    @mock.patch("chat.views.connection.cursor")
+    def test_hides_database_errors(self, cursor):
+        cursor.side_effect = DatabaseError('connection to server at "db.internal", user "app" failed')
+        with self.assertLogs("chat.views", "ERROR"):
+            response = APIClient().get("/api/health")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data, {"database": "error"})
+
+
+class UsageTests(ThreadTestCase):
+    model_fields = {
+        "identifier": "fake-model", "input_token_price": Decimal("2"),
+        "output_token_price": Decimal("10"),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(create_user("admin", is_staff=True))
+
+    @mock.patch("chat.aichat_factory.chat_model_pool.get")
+    def test_exchange_stores_provider_usage(self, get_chat_model):
+        get_chat_model.return_value = FakeListChatModel(responses=["hello there"])
+        self.client.post(f"/api/threads/{self.thread.id}/response", {"user_prompt": "hi"})
+
+        prompt = Prompt.objects.get()
+        self.assertEqual(prompt.model, self.model)
+        self.assertEqual(prompt.model_identifier, "fake-model")
+        self.assertGreater(prompt.input_tokens, 0)
+        self.assertGreater(prompt.output_tokens, 0)
+        self.assertIsNotNone(prompt.latency)
+
+    def create_prompts(self, count):
+        for i in range(count):
+            Prompt.objects.create(
+                thread=self.thread, prompt=f"q{i}", response=f"a{i}", model=self.model,
+                model_identifier=self.model.identifier, input_tokens=1000, output_tokens=100,
+                latency=0.5)
+
+    def test_rollups_and_recent_prompts_add_up(self):
+        self.create_prompts(3)
+        with mock.patch("chat.usage.ROLLUP_LAG", timedelta(0)):
+            self.assertEqual(roll_up_usage(), 3)
+            self.assertEqual(roll_up_usage(), 0)
+        self.create_prompts(1)
+
+        total = self.client.get("/api/usage").data["total"]
+        self.assertEqual(
+            (total["prompts"], total["input_tokens"], total["output_tokens"]), (4, 4000, 400))
+        # 4000 input tokens at 2 and 400 output tokens at 10 per million
+        self.assertEqual(total["cost"], Decimal("0.012"))
+
+        by_user = self.admin_client.get("/api/usage/users").data
+        self.assertEqual([(r["username"], r["prompts"]) for r in by_user], [("tester", 4)])
+        by_model = self.admin_client.get("/api/usage/models").data
+        self.assertEqual([(r["model_identifier"], r["prompts"]) for r in by_model],
+                         [("fake-model", 4)])
+
+    def test_usage_by_user_needs_staff(self):
+        self.assertEqual(self.client.get("/api/usage/users").status_code, 403)
+
+    def test_rejects_invalid_days_and_limit(self):
+        self.assertEqual(self.admin_client.get("/api/usage", {"days": "x"}).status_code, 400)
+        self.assertEqual(self.admin_client.get("/api/usage/users", {"limit": "-1"}).status_code, 400)
+
+        # Capped, not an overflow of the date range or the LIMIT
+        self.assertEqual(self.admin_client.get("/api/usage", {"days": "1000000"}).status_code, 200)
+        self.assertEqual(
+            self.admin_client.get("/api/usage/models", {"days": "10000000000"}).status_code, 200)
+        self.assertEqual(
+            self.admin_client.get("/api/usage/users", {"limit": "10000000000000000000"}).status_code, 200)
+
+
+@skipUnless(connection.vendor == "postgresql", "Full-text search needs Postgres")
+class SearchTests(ThreadTestCase):
+    def setUp(self):
+        super().setUp()
+        thread = self.thread
+        other_thread = Thread.objects.create(title="theirs", model=self.model, user=create_user("other"))
+
+        Prompt.objects.create(thread=thread, prompt="How do penguins swim?", response="With their wings.")
+        Prompt.objects.create(thread=thread, prompt="Where do they live?", response="Penguins live in the south.")
+        Prompt.objects.create(thread=thread, prompt="Unrelated", response="Nothing here.")
+        Prompt.objects.create(thread=other_thread, prompt="Penguins?", response="Penguins.")
+
+    def test_ranks_and_highlights_own_prompts(self):
+        response = self.client.get("/api/search", {"q": "penguin"})
+        self.assertEqual(response.status_code, 200)
+
+        results = response.data["results"]
+        self.assertEqual([r["thread_title"] for r in results], ["thread", "thread"])
+        # Matches in the prompt rank above matches in the response
+        self.assertIn("<mark>penguins</mark>", results[0]["prompt"])
+        self.assertIn("<mark>Penguins</mark>", results[1]["response"])
+
+    def test_rejects_invalid_limit(self):
+        for limit in ("x", "0", "-1"):
+            response = self.client.get("/api/search", {"q": "penguin", "limit": limit})
+            self.assertEqual(response.status_code, 400, limit)
+
+    def test_cursor_pagination(self):
+        first = self.client.get("/api/search", {"q": "penguin", "limit": 1}).data
+        self.assertTrue(first["has_next"])
+
+        second = self.client.get(
+            "/api/search", {"q": "penguin", "limit": 1, "cursor": first["next_cursor"]}).data
+        self.assertFalse(second["has_next"])
+        self.assertNotEqual(first["results"][0]["id"], second["results"][0]["id"])
+
+    def test_missing_query(self):
+        response = self.client.get("/api/search")
+        self.assertEqual(response.status_code, 400)
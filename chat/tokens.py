@@ -0,0 +1,43 @@
+from functools import lru_cache
+import tiktoken
+
+# Turns are counted with a single generic encoding: exact per-provider
+# tokenization doesn't matter for keeping the request inside a budget.
+ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        # Encoding files unavailable (e.g. no network on first use)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def trim_history(messages: list, token_counts: list, budget: int | None) -> list:
+    """
+    Keep the most recent turns (a human/AI message pair each, with their
+    token count in `token_counts`) that fit in `budget` tokens.
+    """
+    if budget is None:
+        return messages
+
+    kept_turns = 0
+    used = 0
+    for count in reversed(token_counts):
+        if used + count > budget:
+            break
+        used += count
+        kept_turns += 1
+
+    return messages[len(messages) - kept_turns * 2:] if kept_turns else []
@@ -3,18 +3,37 @@ from .views import (
     ModelListView,
     ThreadListView,
     get_model,
+    get_thread_date_counts,
     get_prompts_for_thread,
+    export_thread,
+    search,
+    get_usage,
+    get_usage_by_user,
+    get_usage_by_model,
     get_response_for_prompt,
     start_thread,
     delete_thread,
+    health,
 )
+from . import async_views
 
 urlpatterns = [
     path("models", ModelListView.as_view()),
     path("models/<int:model_id>", get_model),
     path("threads", ThreadListView.as_view()),
+    path("threads/dates", get_thread_date_counts),
     path("threads/<int:thread_id>/prompts", get_prompts_for_thread),
+    path("threads/<int:thread_id>/export", export_thread),
     path("threads/<int:thread_id>/response", get_response_for_prompt),
+    path("threads/<int:thread_id>/response/stream", async_views.stream_response_for_prompt),
     path("threads/<int:model_id>/start", start_thread),
     path("threads/<int:thread_id>", delete_thread),
+    path("async/threads/<int:thread_id>/response", async_views.get_response_for_prompt),
+    path("async/threads/<int:model_id>/start", async_views.start_thread),
+    path("jobs/<int:job_id>", async_views.get_generation_job),
+    path("search", search),
+    path("usage", get_usage),
+    path("usage/users", get_usage_by_user),
+    path("usage/models", get_usage_by_model),
+    path("health", health),
 ]
@@ -0,0 +1,173 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Model, ModelUsage, Prompt, UsageRollupState, UserUsage
+
+# Prompts newer than this are left for the next run: a row inserted by a
+# transaction still open could otherwise get an id below the watermark
+ROLLUP_LAG = timedelta(seconds=10)
+ROLLUP_BATCH_SIZE = 20_000
+TOTAL_FIELDS = ("prompts", "input_tokens", "output_tokens", "latency")
+TOTALS = {field: Sum(field) for field in TOTAL_FIELDS}
+
+
+def _prompt_usage(prompts) -> list:
+    """Daily usage per user and model of the `prompts` answered by a provider."""
+    return list(
+        prompts.filter(model__isnull=False, input_tokens__isnull=False)
+        .annotate(date=TruncDate("created_at"))
+        .values("model_id", "date", user_id=F("thread__user_id"))
+        .annotate(prompts=Count("id"), **{field: Sum(field) for field in TOTAL_FIELDS[1:]})
+        .order_by()
+    )
+
+
+def _merge(rollup_model, key_fields: tuple, rows: list):
+    """Add the `rows` totals to the matching `rollup_model` rows, creating missing ones."""
+    totals = {}
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        total = totals.setdefault(key, dict.fromkeys(TOTAL_FIELDS, 0))
+        for field in TOTAL_FIELDS:
+            total[field] += row[field]
+    if not totals:
+        return
+
+    existing = {
+        tuple(getattr(usage, field) for field in key_fields): usage
+        for usage in rollup_model.objects.filter(**{
+            f"{field}__in": {key[index] for key in totals}
+            for index, field in enumerate(key_fields)
+        })
+    }
+
+    created, updated = [], []
+    for key, total in totals.items():
+        usage = existing.get(key)
+        if usage is None:
+            usage = rollup_model(**dict(zip(key_fields, key)))
+            created.append(usage)
+        else:
+            updated.append(usage)
+        for field in TOTAL_FIELDS:
+            setattr(usage, field, getattr(usage, field) + total[field])
+
+    rollup_model.objects.bulk_create(created)
+    rollup_model.objects.bulk_update(updated, TOTAL_FIELDS)
+
+
+def roll_up_usage(batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """
+    Add the provider usage of prompts written since the last run to the
+    daily UserUsage and ModelUsage rollups, reading only those new rows.
+    Returns the number of prompts processed, at most `batch_size`.
+    """
+    with transaction.atomic():
+        state, _ = UsageRollupState.objects.select_for_update().get_or_create(pk=1)
+
+        new_ids = Prompt.objects.filter(
+            id__gt=state.last_prompt_id,
+            created_at__lt=timezone.now() - ROLLUP_LAG,
+        ).order_by("id").values_list("id", flat=True)
+        last_id = new_ids[batch_size - 1:batch_size].first() or new_ids.aggregate(
+            last_id=Max("id"))["last_id"]
+        if last_id is None:
+            return 0
+
+        batch = Prompt.objects.filter(id__gt=state.last_prompt_id, id__lte=last_id)
+        rows = _prompt_usage(batch)
+        _merge(UserUsage, ("user_id", "model_id", "date"), rows)
+        _merge(ModelUsage, ("model_id", "date"), rows)
+
+        state.last_prompt_id = last_id
+        state.save(update_fields=["last_prompt_id"])
+        return batch.count()
+
+
+def _usage_rows(rollup_model, key_field: str, since: date, user=None) -> list:
+    """
+    Usage since `since` per `key_field` and model: the rollups, plus the
+    prompts not rolled up yet (a short id range at the end of the table).
+    """
+    rollups = rollup_model.objects.filter(date__gte=since)
+    recent = Prompt.objects.filter(
+        id__gt=UsageRollupState.objects.filter(pk=1).values_list(
+            "last_prompt_id", flat=True).first() or 0)
+    if user is not None:
+        rollups = rollups.filter(user=user)
+        recent = recent.filter(thread__user=user)
+
+    group_by = dict.fromkeys((key_field, "model_id"))
+    rows = list(rollups.values(*group_by).annotate(**TOTALS).order_by())
+    return rows + [row for row in _prompt_usage(recent) if row["date"] >= since]
+
+
+def _cost(model: Model, input_tokens: int, output_tokens: int):
+    if model.input_token_price is None and model.output_token_price is None:
+        return None
+    return (
+        input_tokens * (model.input_token_price or 0)
+        + output_tokens * (model.output_token_price or 0)
+    ) / Decimal(1_000_000)
+
+
+def _summarize(rows: list, key_field: str) -> list:
+    """Totals and cost per `key_field`, most tokens first."""
+    models = Model.objects.in_bulk({row["model_id"] for row in rows})
+    reports = {}
+    for row in rows:
+        report = reports.get(row[key_field])
+        if report is None:
+            report = reports[row[key_field]] = {
+                key_field: row[key_field], **dict.fromkeys(TOTAL_FIELDS, 0), "cost": None}
+        for field in TOTAL_FIELDS:
+            report[field] += row[field]
+
+        # Prices differ per model, so costs are added up row by row
+        cost = _cost(models[row["model_id"]], row["input_tokens"], row["output_tokens"])
+        if cost is not None:
+            report["cost"] = (report["cost"] or 0) + cost
+
+    for report in reports.values():
+        report["latency"] = round(report["latency"], 3)
+        # Large averages point at huge threads resent with every prompt
+        report["avg_input_tokens"] = round(report["input_tokens"] / report["prompts"])
+        if report["cost"] is not None:
+            report["cost"] = round(report["cost"], 6)
+        if key_field == "model_id":
+            report["model_identifier"] = models[report["model_id"]].identifier
+
+    return sorted(
+        reports.values(),
+        key=lambda report: report["input_tokens"] + report["output_tokens"],
+        reverse=True,
+    )
+
+
+def user_usage(user, since: date) -> dict:
+    """A user's usage since `since`, in total and per model."""
+    rows = _usage_rows(UserUsage, "user_id", since, user=user)
+    total = _summarize(rows, "user_id")
+    return {
+        "since": since,
+        "total": total[0] if total else None,
+        "models": _summarize(rows, "model_id"),
+    }
+
+
+def usage_by_user(since: date, limit: int) -> list:
+    """The `limit` users that used the most tokens since `since`."""
+    reports = _summarize(_usage_rows(UserUsage, "user_id", since), "user_id")[:limit]
+    usernames = dict(User.objects.filter(
+        id__in=[report["user_id"] for report in reports]).values_list("id", "username"))
+    for report in reports:
+        report["username"] = usernames.get(report["user_id"])
+    return reports
+
+
+def usage_by_model(since: date) -> list:
+    return _summarize(_usage_rows(ModelUsage, "model_id", since), "model_id")
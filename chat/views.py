@@ -1,48 +1,137 @@
-from django.shortcuts import get_object_or_404
-from rest_framework.generics import ListAPIView
+import logging
+import orjson
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Thread, Prompt, Model
-from .serializers import CustomTokenObtainPairSerializer, ModelSerializer, SignupSerializer, ThreadSerializer, PromptSerializer
+from .models import Thread, Prompt
+from .serializers import (
+    CustomTokenObtainPairSerializer,
+    SignupSerializer,
+    ThreadSerializer,
+    GenerationJobSerializer,
+    LOCAL_TZ,
+    PROMPT_LIST_FIELDS,
+    THREAD_LIST_FIELDS,
+    serialize_prompt_rows,
+    serialize_thread_rows,
+)
 from .aichat_factory import LangChainModel
+from .jobs import enqueue_job
+from .writes import prompt_writer
+from .metrics import cache_stats_lines, render as render_metrics
+from .response_cache import response_cache
+from .semantic_cache import semantic_cache
+from .catalog import get_catalog, get_catalog_with
+from .conditional import conditional_response, listing_etag, page_etag
+from .pagination import encode_cursor, rows_before
+from .search import search_prompts
+from .usage import usage_by_model, usage_by_user, user_usage
 from collections import defaultdict
+from django.db import DatabaseError, connection
+from django.db.models import Count, Q, Subquery
 from django.db.models.functions import TruncDate
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
-from datetime import datetime
+from datetime import timedelta
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils.timezone import localtime
 from django.utils import timezone
-from zoneinfo import ZoneInfo
-from django.conf import settings
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+logger = logging.getLogger(__name__)
 
-class ModelListView(ListAPIView):
-    queryset = Model.objects.all().order_by('provider__name')
-    serializer_class = ModelSerializer
+
+class ModelListView(APIView):
+    def get(self, request):
+        catalog = get_catalog()
+        return conditional_response(
+            request, catalog["etag"], catalog["last_modified"], lambda: catalog["models"])
 
 
 @api_view(['GET'])
 def get_model(request, model_id):
-    model = get_object_or_404(Model, pk=model_id)
-    serializer = ModelSerializer(model)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    catalog = get_catalog_with(model_id)
+    model = catalog["by_id"].get(model_id)
+    if model is None:
+        return Response({"detail": "No Model matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+    return conditional_response(
+        request, catalog["etag"], catalog["last_modified"], lambda: model)
+
+
+def positive_int_param(request, name: str, default: int = None, maximum: int = None) -> int:
+    """Query parameter `name` as an integer of at least 1, capped at `maximum`. Raises ValueError."""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ValueError(f"Invalid {name}: must be a positive integer")
+    return min(value, maximum) if maximum is not None else value
+
+
+def request_timezone(request) -> ZoneInfo:
+    """The `tz` query parameter (an IANA name), settings.TIME_ZONE without it."""
+    name = request.query_params.get("tz")
+    if not name:
+        return LOCAL_TZ
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+MAX_PAGE_SIZE = 100
 
 
 class ThreadListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        page = int(request.query_params.get("page", 1))
-        page_size = int(request.query_params.get("pageSize", 20))
+        try:
+            page_size = positive_int_param(request, "pageSize", 20, MAX_PAGE_SIZE)
+            tz = request_timezone(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Threads are bucketed by their local date in the database
         threads = Thread.objects.filter(
-            user=request.user).order_by('-created_at')
+            user=request.user).order_by('-created_at', '-id').values(
+                *THREAD_LIST_FIELDS, created_at_date=TruncDate("created_at", tzinfo=tz))
+
+        # Keyset pagination, opted into by passing `cursor` (empty for the first page)
+        if "cursor" in request.query_params:
+            cursor = request.query_params["cursor"]
+            try:
+                threads_after_cursor = threads.filter(rows_before(cursor)) if cursor else threads
+            except ValueError:
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+            # The ETag comes from the page itself, not from all the user's threads
+            page_threads = list(threads_after_cursor[:page_size + 1])
+            etag = page_etag(request, page_threads, get_catalog()["etag"])
+            return conditional_response(
+                request, etag, build_data=lambda: self.get_by_cursor(page_threads, page_size, tz))
+
+        # Threads embed model names, so catalog changes must change the ETag too
+        etag, stats = listing_etag(request, threads, get_catalog()["etag"])
+
+        # Not a number: the paginator answers with the first page
+        page = request.query_params.get("page", 1)
 
         paginator = Paginator(threads, page_size)
+        # Already counted for the ETag, spare the paginator its COUNT query
+        paginator.count = stats["count"]
 
+        return conditional_response(
+            request, etag, build_data=lambda: self.get_page(paginator, page, tz))
+
+    def get_page(self, paginator, page, tz):
         try:
             paginated_threads = paginator.page(page)
         except PageNotAnInteger:
@@ -50,43 +139,184 @@ class ThreadListView(APIView):
         except EmptyPage:
             paginated_threads = paginator.page(paginator.num_pages)
 
-        user_tz = ZoneInfo(settings.TIME_ZONE)
-        utc = ZoneInfo("UTC")
-
+        return {
+            "current_page": paginated_threads.number,
+            "has_next": paginated_threads.has_next(),
+            "results": self.group_by_date(list(paginated_threads), tz)
+        }
+
+    def get_by_cursor(self, page_threads, page_size, tz):
+        has_next = len(page_threads) > page_size
+        page_threads = page_threads[:page_size]
+
+        next_cursor = None
+        if has_next:
+            last = page_threads[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+
+        return {
+            "next_cursor": next_cursor,
+            "has_next": has_next,
+            "results": self.group_by_date(page_threads, tz)
+        }
+
+    def group_by_date(self, page_threads, tz):
+        # created_at_date is the thread's local date at midnight, the group key
         grouped = defaultdict(list)
-        for thread in paginated_threads:
-            created_at = thread.created_at
-
-            if timezone.is_naive(created_at):
-                created_at = created_at.replace(tzinfo=utc)
+        for serialized in serialize_thread_rows(page_threads, tz):
+            grouped[serialized["created_at_date"]].append(serialized)
 
-            localized_dt = created_at.astimezone(user_tz)
-            date_key = localized_dt.date()
-
-            serialized = ThreadSerializer(thread).data
-            grouped[date_key].append(serialized)
-
-        result = [
+        return [
             {
-                "date": datetime.combine(date, datetime.min.time()).isoformat(),
+                "date": date,
                 "threads": threads
             }
             for date, threads in grouped.items()
         ]
 
-        return Response({
-            "current_page": paginated_threads.number,
-            "has_next": paginated_threads.has_next(),
-            "results": result
-        })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_thread_date_counts(request):
+    """Number of threads per local date, newest first, for the sidebar headers."""
+    try:
+        tz = request_timezone(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    threads = Thread.objects.filter(user=request.user)
+    etag, _ = listing_etag(request, threads)
+
+    def build_counts():
+        counts = threads.annotate(date=TruncDate("created_at", tzinfo=tz)).values(
+            "date").annotate(count=Count("id")).order_by("-date")
+        return [
+            {"date": row["date"].isoformat() + "T00:00:00", "count": row["count"]}
+            for row in counts
+        ]
+
+    return conditional_response(request, etag, build_data=build_counts)
+
+
+PROMPT_PAGE_SIZE = 50
+MAX_PROMPT_PAGE_SIZE = 200
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_prompts_for_thread(request, thread_id):
     prompts = Prompt.get_prompts_by_thread(thread_id)
-    serializer = PromptSerializer(prompts, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+
+    before = request.query_params.get("before")
+    since = request.query_params.get("since")
+
+    if since:
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"error": "Invalid since"}, status=status.HTTP_400_BAD_REQUEST)
+    if before:
+        try:
+            prompts_before = prompts.reverse().filter(rows_before(before))
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Without `limit`, `since` or `before` the whole history is returned, as before
+    if not ("limit" in request.query_params or since or before):
+        etag, _ = listing_etag(request, prompts)
+        return conditional_response(
+            request, etag, build_data=lambda: serialize_prompt_rows(prompts.values(*PROMPT_LIST_FIELDS)))
+
+    try:
+        limit = positive_int_param(request, "limit", PROMPT_PAGE_SIZE, MAX_PROMPT_PAGE_SIZE)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if since:
+        # Prompts newer than prompt `since`, oldest first (polling for new turns)
+        since_created_at = Subquery(
+            Prompt.objects.filter(thread_id=thread_id, id=since).values("created_at"))
+        page = list(prompts.filter(
+            Q(created_at__gt=since_created_at) | Q(created_at=since_created_at, id__gt=since)
+        ).values(*PROMPT_LIST_FIELDS)[:limit + 1])
+    else:
+        # Newest page first, `before` moves on to older history
+        newest_first = prompts_before if before else prompts.reverse()
+        page = list(newest_first.values(*PROMPT_LIST_FIELDS)[:limit + 1])
+
+    # The ETag comes from the page itself, not from the whole history
+    etag = page_etag(request, page)
+
+    def build_page():
+        has_next = len(page) > limit
+        rows = page[:limit]
+        next_cursor = None
+        if not since:
+            if has_next:
+                next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+            rows.reverse()
+
+        return {
+            "next_cursor": next_cursor,
+            "has_next": has_next,
+            "results": serialize_prompt_rows(rows)
+        }
+
+    return conditional_response(request, etag, build_data=build_page)
+
+
+MAX_SEARCH_LIMIT = 100
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    text = request.query_params.get("q", "").strip()
+    if not text:
+        return Response({"error": "Missing search query"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        limit = positive_int_param(request, "limit", 20, MAX_SEARCH_LIMIT)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = search_prompts(request.user, text, limit, request.query_params.get("cursor"))
+    except ValueError:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(results)
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_thread(request, thread_id):
+    if not Thread.objects.filter(id=thread_id, user=request.user).exists():
+        return Response({"error": "Thread not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    prompts = Prompt.get_prompts_by_thread(thread_id).values(
+        "id", "prompt", "response", "created_at")
+
+    def ndjson_line(row):
+        row["created_at"] = localtime(row["created_at"])
+        return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+    # One JSON document per line, rows read in chunks so memory stays flat.
+    # Under ASGI a sync iterator would be read into a list before the first
+    # byte is sent, so rows are streamed from an async iterator there.
+    if isinstance(request._request, ASGIRequest):
+        async def ndjson_lines():
+            async for row in prompts.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+                yield ndjson_line(row)
+    else:
+        def ndjson_lines():
+            for row in prompts.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                yield ndjson_line(row)
+
+    response = StreamingHttpResponse(ndjson_lines(), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="thread-{thread_id}.ndjson"'
+    return response
 
 
 @api_view(['POST'])
@@ -94,26 +324,29 @@ def get_prompts_for_thread(request, thread_id):
 def get_response_for_prompt(request, thread_id):
     data = request.data
 
-    thread = Thread.objects.get(id=thread_id)
+    thread = Thread.objects.select_related("model__provider").filter(id=thread_id).first()
     if not thread:
         return Response({"error": "Thread not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    aichat_model = LangChainModel(thread)
-
     user_prompt = data.get('user_prompt')
+    if not user_prompt:
+        return Response({"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Queue the generation for a worker instead of waiting on the provider
+    if request.query_params.get('async') in ('1', 'true'):
+        job = enqueue_job(thread, request.user, user_prompt)
+        serializer = GenerationJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    aichat_model = LangChainModel(thread)
 
     try:
         response = aichat_model.get_response(user_prompt=user_prompt)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Save the prompt and response
-    prompt = Prompt.objects.create(
-        thread=thread,
-        prompt=user_prompt,
-        response=response
-    )
-    prompt.save()
+    # Save the prompt and response, a single insert
+    prompt_writer.save(thread, user_prompt, response, aichat_model.usage)
     # Return the response
     return Response({"response": response}, status=status.HTTP_200_OK)
 
@@ -132,7 +365,6 @@ def start_thread(request, model_id):
     except Exception as e:
         return Response({"error": "There is already a thread with this title"}, status=status.HTTP_400_BAD_REQUEST)
 
-    thread.save()
     serializer = ThreadSerializer(thread)
     return Response({"thread": serializer.data}, status=status.HTTP_201_CREATED)
 
@@ -148,6 +380,82 @@ def delete_thread(request, thread_id):
     return Response({"message": "Thread deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+USAGE_DAYS = 30
+# Ten years, far larger periods overflow the date arithmetic
+MAX_USAGE_DAYS = 3650
+MAX_USAGE_LIMIT = 1000
+
+
+def usage_since(request):
+    """First day of the `days` (default 30) long period ending today. Raises ValueError."""
+    days = positive_int_param(request, "days", USAGE_DAYS, MAX_USAGE_DAYS)
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_usage(request):
+    try:
+        since = usage_since(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(user_usage(request.user, since))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_usage_by_user(request):
+    try:
+        since = usage_since(request)
+        limit = positive_int_param(request, "limit", 50, MAX_USAGE_LIMIT)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(usage_by_user(since, limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_usage_by_model(request):
+    try:
+        since = usage_since(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(usage_by_model(since))
+
+
+def metrics(request):
+    """Prometheus text exposition of the request, provider and cache metrics."""
+    body = render_metrics(
+        cache_stats_lines(
+            "llm_response_cache_requests_total", "Exact response cache lookups.",
+            response_cache.stats()),
+        cache_stats_lines(
+            "llm_semantic_cache_requests_total", "Semantic cache lookups.",
+            semantic_cache.stats()),
+    )
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@api_view(['GET'])
+def health(request):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError:
+        # The error names the database host and user, keep it out of this public endpoint
+        logger.exception("Health check could not reach the database")
+        return Response({"database": "error"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    result = {"database": "ok"}
+
+    # Only available with DB_POOL (psycopg 3 connection pool)
+    pool = getattr(connection, "pool", None)
+    if pool is not None and request.user.is_staff:
+        result["pool"] = pool.get_stats()
+
+    return Response(result, status=status.HTTP_200_OK)
+
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
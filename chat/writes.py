@@ -0,0 +1,110 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from .models import Prompt, Thread
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+
+
+def build_prompt(thread: Thread, prompt: str, response: str, usage: dict = None) -> Prompt:
+    """`usage` is LangChainModel.usage: the answering model, tokens and latency."""
+    row = Prompt(thread=thread, prompt=prompt, response=response)
+    # bulk_create skips save(), so count tokens here
+    row.token_count = row.compute_token_count()
+    if usage is not None:
+        row.model = usage["model"]
+        row.model_identifier = usage["model"].identifier
+        row.input_tokens = usage["input_tokens"]
+        row.output_tokens = usage["output_tokens"]
+        row.latency = usage["latency"]
+    return row
+
+
+class PromptWriter:
+    """
+    Persists each exchange (a prompt and its response) as one Prompt row,
+    once the provider has answered, so failed calls leave nothing behind.
+
+    With `buffer_size` 0 every row is a single INSERT. Otherwise rows are
+    buffered and bulk-inserted by a background thread when `buffer_size`
+    rows are waiting or every `flush_interval` seconds. Buffered rows only
+    show up in listings and history once flushed, and are lost if the
+    process is killed before that.
+    """
+
+    def __init__(self, buffer_size: int, flush_interval: float):
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    @property
+    def buffered(self) -> bool:
+        return self._buffer_size > 0
+
+    def save(self, thread: Thread, prompt: str, response: str, usage: dict = None):
+        row = build_prompt(thread, prompt, response, usage)
+        if not self.buffered:
+            row.save()
+            return
+        self._enqueue(row)
+
+    async def asave(self, thread: Thread, prompt: str, response: str, usage: dict = None):
+        row = build_prompt(thread, prompt, response, usage)
+        if not self.buffered:
+            await row.asave()
+            return
+        self._enqueue(row)
+
+    def _enqueue(self, row: Prompt):
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self._buffer_size
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run, name="prompt-writer", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Insert the buffered rows, returns how many were written."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        # A thread deleted since its rows were buffered would fail the whole batch
+        thread_ids = set(Thread.objects.filter(
+            id__in={row.thread_id for row in rows}).values_list("id", flat=True))
+        orphans = sum(row.thread_id not in thread_ids for row in rows)
+        if orphans:
+            logger.warning("Dropped %d buffered prompt(s) of deleted threads", orphans)
+            rows = [row for row in rows if row.thread_id in thread_ids]
+
+        Prompt.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+        return len(rows)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error writing buffered prompts, they were dropped")
+            finally:
+                close_old_connections()
+
+
+prompt_writer = PromptWriter(
+    buffer_size=settings.PROMPT_WRITE_BUFFER_SIZE,
+    flush_interval=settings.PROMPT_WRITE_FLUSH_INTERVAL,
+)
@@ -17,6 +17,12 @@ from datetime import timedelta
 
 load_dotenv()
 
+
+def env(name: str, default=None):
+    """Environment variable `name`, `default` when unset or left empty as in env.example."""
+    return os.getenv(name) or default
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "chat.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -86,6 +93,11 @@ WSGI_APPLICATION = "llmsbackend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are either kept open per worker thread for DB_CONN_MAX_AGE
+# seconds, or, with DB_POOL=true, taken from Django's psycopg 3 connection
+# pool (recommended when serving through ASGI).
+DB_POOL = env("DB_POOL", "false").lower() in ("1", "true", "yes")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -94,6 +106,15 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASS", "rootllmstudio2025**"),
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", 5432),
+        "CONN_MAX_AGE": 0 if DB_POOL else int(env("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(env("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(env("DB_POOL_MAX_SIZE", 10)),
+                "timeout": float(env("DB_POOL_TIMEOUT", 10)),
+            }
+        } if DB_POOL else {},
     }
 }
 
@@ -143,7 +164,16 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+    ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "chat.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "chat.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
 SIMPLE_JWT = {
@@ -161,3 +191,61 @@ AUTHENTICATION_BACKENDS = (
 
 SITE_ID = 1
 REST_USE_JWT = True
+
+# Pool of initialized chat model clients (see chat/aichat_factory.py)
+CHAT_MODEL_POOL_SIZE = int(env("CHAT_MODEL_POOL_SIZE", 32))
+CHAT_MODEL_POOL_TTL = int(env("CHAT_MODEL_POOL_TTL", 3600))
+
+# Per-thread conversation history cache (see chat/history.py)
+HISTORY_CACHE_MAX_THREADS = int(env("HISTORY_CACHE_MAX_THREADS", 1000))
+HISTORY_CACHE_MAX_CHARS = int(env("HISTORY_CACHE_MAX_CHARS", 50_000_000))
+
+# Seconds the serialized model catalog is cached (see chat/catalog.py). It is
+# also invalidated on changes, this bounds staleness in other processes.
+CATALOG_CACHE_TTL = int(env("CATALOG_CACHE_TTL", 300))
+
+# Cache for responses to identical prompts (see chat/response_cache.py).
+# Any Django cache backend works: locmem, db (run createcachetable) or file.
+RESPONSE_CACHE_ALIAS = "responses"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    RESPONSE_CACHE_ALIAS: {
+        "BACKEND": env(
+            "RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": env("RESPONSE_CACHE_LOCATION", "llm-responses"),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(env("RESPONSE_CACHE_MAX_ENTRIES", 10000)),
+        },
+    },
+}
+
+# Embedding-similarity cache for paraphrased prompts (see chat/semantic_cache.py).
+# The default embedding model runs locally and needs sentence-transformers.
+SEMANTIC_CACHE_EMBEDDING_MODEL = env(
+    "SEMANTIC_CACHE_EMBEDDING_MODEL", "huggingface:sentence-transformers/all-MiniLM-L6-v2"
+)
+SEMANTIC_CACHE_MAX_ENTRIES = int(env("SEMANTIC_CACHE_MAX_ENTRIES", 100_000))
+SEMANTIC_CACHE_ANN_THRESHOLD = int(env("SEMANTIC_CACHE_ANN_THRESHOLD", 20_000))
+
+# Provider/model concurrency and rate limits are enforced per process (see
+# chat/scheduler.py): set this to the number of processes calling providers
+# (web workers plus run_generation_worker) and each one gets its share.
+PROVIDER_LIMIT_PROCESSES = max(int(env("PROVIDER_LIMIT_PROCESSES", 1)), 1)
+
+# Providers failing this many times in a row are skipped for the timeout (seconds)
+CIRCUIT_BREAKER_FAILURES = int(env("CIRCUIT_BREAKER_FAILURES", 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(env("CIRCUIT_BREAKER_RESET_TIMEOUT", 30))
+
+# Prompt rows are inserted one per exchange, or with PROMPT_WRITE_BUFFER_SIZE > 0
+# buffered and bulk-inserted every PROMPT_WRITE_FLUSH_INTERVAL seconds (see chat/writes.py)
+PROMPT_WRITE_BUFFER_SIZE = int(env("PROMPT_WRITE_BUFFER_SIZE", 0))
+PROMPT_WRITE_FLUSH_INTERVAL = float(env("PROMPT_WRITE_FLUSH_INTERVAL", 1))
+
+# Models of the "fake" provider are answered locally by chat/fake_llm.py (benchmarks)
+FAKE_LLM_LATENCY = float(env("FAKE_LLM_LATENCY", 0.2))
+FAKE_LLM_TOKENS_PER_SECOND = float(env("FAKE_LLM_TOKENS_PER_SECOND", 0))
+FAKE_LLM_FAILURE_RATE = float(env("FAKE_LLM_FAILURE_RATE", 0))
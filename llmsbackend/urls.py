@@ -20,12 +20,13 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
-from chat.views import CustomTokenObtainPairView, SignupView
+from chat.views import CustomTokenObtainPairView, SignupView, metrics
 
 
 urlpatterns = [
     path("admin", admin.site.urls),
     path("api/", include("chat.urls")),
+    path("metrics", metrics),
     path(
         "api/auth/login", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"
     ),